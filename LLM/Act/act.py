@@ -43,7 +43,8 @@ class Actor:
 
 
     def _set_up_env(self, save_path):
-        self._env = crafter.Env(seed=self._seed)
+        # The info dict of a step is not used here.
+        self._env = crafter.Env(seed=self._seed, info_keys=())
         self._env = crafter.Recorder(
             self._env, save_path,
             save_stats=False,
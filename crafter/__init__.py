@@ -1,2 +1,11 @@
 from .env import Env
-from .recorder import Recorder
\ No newline at end of file
+from .recorder import Recorder
+
+
+def __getattr__(name):
+  # The vector environment pulls in multiprocessing, so it is only imported
+  # when used.
+  if name == 'VecEnv':
+    from .vector import VecEnv
+    return VecEnv
+  raise AttributeError(f"module 'crafter' has no attribute '{name}'")
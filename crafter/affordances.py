@@ -0,0 +1,196 @@
+import functools
+
+import numpy as np
+
+from . import constants
+
+# Available actions of the player as discovered by language models. A state is
+# packed into an integer key made of the material and object kind of the four
+# neighbouring cells, the facing direction, bits for the materials nearby and
+# bits for the inventory thresholds that the rules test. The actions for a key
+# are derived once and cached.
+
+_DIRS = ((-1, 0), (+1, 0), (0, -1), (0, +1))
+_DIR_NAMES = ('west', 'east', 'north', 'south')
+_FACING = {direction: index for index, direction in enumerate(_DIRS)}
+_MATERIALS = [None] + constants.materials
+KINDS = (None, 'cow', 'skeleton', 'zombie', 'plant', 'plant-ripe', 'other')
+_KIND_IDS = {name: index for index, name in enumerate(KINDS)}
+_BLOCKING = ('cow', 'skeleton', 'zombie', 'plant', 'plant-ripe')
+_OBSTACLES = ('tree', 'stone', 'coal', 'iron', 'diamond', 'water')
+_CELL_BITS = 7
+
+
+def _collect(material, **extra):
+  info = constants.collect[material]
+  item, = info['receive']
+  return (
+      f'collect_{item}_on_{{facing}}', (material,), None,
+      dict(info['require'], **extra), ())
+
+
+def _make(name, **extra):
+  info = constants.make[name]
+  return (
+      f'make_{name}', None, None, dict(info['uses'], **extra),
+      tuple(info['nearby']))
+
+
+def _place(name, where, nearby=()):
+  # Placing needs an empty facing cell.
+  return (
+      f'place_{name}_on_{{material}}_to_{{facing}}', where, (None,),
+      constants.place[name]['uses'], nearby)
+
+
+# Rules in the order their actions are listed: the template of the action,
+# the materials and object kinds allowed in the facing cell, the inventory
+# requirements and the materials that need to be nearby. Some rules ask for
+# more than the game itself does, which is kept as discovered.
+_RULES = [
+    _collect('water', wood_pickaxe=1),
+    _collect('tree'),
+    _collect('stone'),
+    _collect('coal'),
+    _collect('iron'),
+    _collect('diamond'),
+    _collect('grass', wood_pickaxe=1, wood_sword=1),
+    ('place_plant_on_{facing}', ('grass',), None,
+     dict(constants.place['plant']['uses'], wood_pickaxe=1, wood_sword=1), ()),
+    ('eat_cow_on_{facing}', None, ('cow',),
+     {'wood_sword': 1, 'wood_pickaxe': 1}, ()),
+    ('defeat_skeleton_on_{facing}', None, ('skeleton',),
+     {'wood_sword': 1}, ()),
+    ('defeat_zombie_on_{facing}', None, ('zombie',), {'wood_sword': 1}, ()),
+    ('eat_plant_on_{facing}', None, ('plant-ripe',),
+     {'iron_sword': 1}, ('stone',)),
+    _make('wood_pickaxe'),
+    _make('wood_sword', wood_pickaxe=1),
+    _make('stone_pickaxe'),
+    _make('stone_sword', stone_pickaxe=1),
+    _make('iron_pickaxe'),
+    _make('iron_sword', iron_pickaxe=1),
+    _place('table', ('grass', 'path')),
+    _place('furnace', ('grass', 'path'), ('table',)),
+    _place('stone', tuple(constants.place['stone']['where'])),
+    ('sleep', None, None, {'stone_sword': 1}, ('stone', 'path')),
+]
+_THRESHOLDS = list(dict.fromkeys(
+    item for rule in _RULES for item in rule[3].items()))
+# Inventory thresholds by column of the inventory array.
+_COLUMNS = [
+    (list(constants.items).index(item), amount)
+    for item, amount in _THRESHOLDS]
+_NEARBY = list(dict.fromkeys(name for rule in _RULES for name in rule[4]))
+_NEARBY_BITS = np.array([
+    1 << _NEARBY.index(name) if name in _NEARBY else 0
+    for name in _MATERIALS], np.int64)
+_FACING_SHIFT = 4 * _CELL_BITS
+_NEARBY_SHIFT = _FACING_SHIFT + 2
+_INVENTORY_SHIFT = _NEARBY_SHIFT + len(_NEARBY)
+_COMPILED = [
+    (template, where, kinds,
+     sum(1 << _THRESHOLDS.index(item) for item in need.items()),
+     sum(1 << _NEARBY.index(name) for name in nearby))
+    for template, where, kinds, need, nearby in _RULES]
+
+
+def available(player):
+  return list(actions(encode(player)))
+
+
+def kind(obj):
+  if obj is None:
+    return 0
+  return _KIND_IDS.get(obj.texture, len(KINDS) - 1)
+
+
+def encode(player):
+  world = player.world
+  x, y = player.pos.tolist()
+  # The same slices as World.nearby, which are cut short at the border.
+  materials = world._mat_map[x - 1: x + 2, y - 1: y + 2]
+  nearby = 0
+  for index in set(materials.flatten().tolist()):
+    nearby |= int(_NEARBY_BITS[index])
+  key = nearby << _NEARBY_SHIFT
+  key |= _FACING[tuple(player.facing)] << _FACING_SHIFT
+  if materials.shape == (3, 3):
+    indices = world._obj_map[x - 1: x + 2, y - 1: y + 2].tolist()
+    materials = materials.tolist()
+    cells = [(i + 1, j + 1) for i, j in _DIRS]
+  else:
+    indices = materials = None
+    cells = [(x + i, y + j) for i, j in _DIRS]
+  for index, (i, j) in enumerate(cells):
+    if materials is not None:
+      material, obj = materials[i][j], world._objects[indices[i][j]]
+    elif 0 <= i < world.area[0] and 0 <= j < world.area[1]:
+      material = int(world._mat_map[i, j])
+      obj = world._objects[world._obj_map[i, j]]
+    else:
+      continue
+    key |= (material | kind(obj) << 4) << (_CELL_BITS * index)
+  counts = player.inventory.array.tolist()
+  for bit, (column, amount) in enumerate(_COLUMNS):
+    if counts[column] >= amount:
+      key |= 1 << (_INVENTORY_SHIFT + bit)
+  return key
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def actions(key):
+  cells = [(key >> (_CELL_BITS * index)) & 0x7f for index in range(4)]
+  materials = [_MATERIALS[cell & 0xf] for cell in cells]
+  kinds = [KINDS[cell >> 4] for cell in cells]
+  facing = (key >> _FACING_SHIFT) & 3
+  nearby = (key >> _NEARBY_SHIFT) & ((1 << len(_NEARBY)) - 1)
+  inventory = key >> _INVENTORY_SHIFT
+  result = []
+  for index, direction in enumerate(_DIR_NAMES):
+    material, obj = materials[index], kinds[index]
+    if material in constants.walkable and obj not in _BLOCKING:
+      result.append(f'move_{direction}')
+    elif index != facing:
+      if obj in _BLOCKING:
+        result.append(f'face_{direction}_obstructed_by_{obj}')
+      if material in _OBSTACLES:
+        result.append(f'face_{direction}_obstructed_by_{material}')
+  material, obj = materials[facing], kinds[facing]
+  for template, where, allowed, need, near in _COMPILED:
+    if where is not None and material not in where:
+      continue
+    if allowed is not None and obj not in allowed:
+      continue
+    if inventory & need != need or nearby & near != near:
+      continue
+    result.append(template.format(
+        facing=_DIR_NAMES[facing], material=material))
+  return tuple(result)
+
+
+def pack(materials, kinds, facing, nearby, inventory):
+  # Keys of many states at once. Materials and kinds are the ids of the cells
+  # to the west, east, north and south with shape (N, 4), facing indexes those
+  # cells, nearby holds the material ids around each state in any trailing
+  # shape, and inventory the counts in the order of constants.items, like the
+  # array of Player.inventory.
+  materials = np.asarray(materials, np.int64)
+  kinds = np.asarray(kinds, np.int64)
+  shifts = _CELL_BITS * np.arange(4)
+  keys = ((materials | kinds << 4) << shifts).sum(1)
+  keys |= np.asarray(facing, np.int64) << _FACING_SHIFT
+  nearby = _NEARBY_BITS[np.asarray(nearby).reshape(len(keys), -1)]
+  keys |= np.bitwise_or.reduce(nearby, 1) << _NEARBY_SHIFT
+  columns, amounts = zip(*_COLUMNS)
+  passed = np.asarray(inventory)[:, columns] >= amounts
+  bits = np.int64(1) << (_INVENTORY_SHIFT + np.arange(len(_THRESHOLDS)))
+  keys |= (passed * bits).sum(1)
+  return keys
+
+
+def available_many(keys):
+  # Actions for many packed states, deriving each distinct state only once.
+  unique, inverse = np.unique(np.asarray(keys), return_inverse=True)
+  found = [actions(key) for key in unique.tolist()]
+  return [list(found[index]) for index in inverse.ravel().tolist()]
@@ -0,0 +1,217 @@
+import json
+import os
+import pathlib
+
+import numpy as np
+
+from . import objects
+
+# Layout: magic, format version and header length, followed by a JSON header
+# and the raw arrays it describes. Arrays start at aligned offsets so that they
+# can be viewed directly from a read-only memory map of the file.
+MAGIC = b'CRAFTER\0'
+VERSION = 1
+ALIGN = 64
+
+TYPES = (
+    objects.Player, objects.Cow, objects.Zombie, objects.Skeleton,
+    objects.Arrow, objects.Plant, objects.Fence)
+
+
+def save(env, path):
+  world, player = env._world, env._player
+  live = world.objects
+  kind, key, pos, has_gauss, cached_gaussian = world.random.get_state()
+  assert kind == 'MT19937', kind
+  # Plants store their grown value rather than the reach counts of the world
+  # that it derives from, which start over at zero when loading. This only
+  # holds between steps, when no reach is waiting to be settled.
+  assert world._reaching is None, 'Checkpoints are saved between steps.'
+  arrays = {
+      'mat_map': world._mat_map,
+      'random_key': np.asarray(key, np.uint32),
+      # The object table is stored column by column in update order. Columns
+      # that do not apply to an object type hold zeros.
+      'obj_type': np.array([TYPES.index(type(obj)) for obj in live], np.uint8),
+      'obj_pos': np.array([obj.pos for obj in live], np.int32).reshape(-1, 2),
+      # Slots decide where new objects go when slots are reused.
+      'obj_slot': np.array(
+          [world._obj_map[tuple(obj.pos)] for obj in live], np.uint32),
+      'obj_health': np.array([obj.health for obj in live], np.int32),
+      'obj_cooldown': _column(live, 'cooldown', np.int32),
+      'obj_reload': _column(live, 'reload', np.int32),
+      'obj_grown': _column(live, 'grown', np.int32),
+      'obj_facing': np.array(
+          [getattr(obj, 'facing', (0, 0)) for obj in live],
+          np.int8).reshape(-1, 2),
+  }
+  header = {
+      'area': list(world.area),
+      'materials': [world._mat_names[i] for i in range(len(world._mat_names))],
+      'types': [cls.__name__ for cls in TYPES],
+      'random': [int(pos), int(has_gauss), float(cached_gaussian)],
+      'daylight': float(world.daylight),
+      'episode': env._episode,
+      'step': env._step,
+      'last_health': env._last_health,
+      'unlocked': sorted(env._unlocked),
+      'balanced': [
+          [int(x) for x in key] + [step]
+          for key, step in env._balanced.items()],
+      'frame': env._local_view._frame,
+      # Chunks are balanced in insertion order, which includes empty chunks.
+      'chunks': [[int(x) for x in key] for key in world._chunks],
+      'slots': {
+          'size': len(world._objects),
+          'free': [int(x) for x in world._free],
+          'holes': world._holes,
+      },
+      'player': {
+          'index': live.index(player),
+          'inventory': {k: int(v) for k, v in player.inventory.items()},
+          'achievements': {k: int(v) for k, v in player.achievements.items()},
+          'action': player.action,
+          'sleeping': player.sleeping,
+          'last_health': player._last_health,
+          'hunger': player._hunger,
+          'thirst': player._thirst,
+          'fatigue': player._fatigue,
+          'recover': player._recover,
+      },
+      'arrays': {},
+  }
+  start = 0
+  for name, array in arrays.items():
+    array = np.ascontiguousarray(array)
+    arrays[name] = array
+    header['arrays'][name] = {
+        'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': start}
+    start = _align(start + array.nbytes)
+  encoded = json.dumps(header).encode('utf-8')
+  prefix = MAGIC + np.array([VERSION, len(encoded)], '<u4').tobytes()
+  # Write next to the target and rename, so that readers never see a partial
+  # checkpoint. The temporary name is unique to the process, so that several
+  # processes can write the same checkpoint.
+  path = pathlib.Path(path)
+  temp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+  with temp.open('wb') as f:
+    f.write(prefix + encoded)
+    data = _align(f.tell())
+    for name, array in arrays.items():
+      f.seek(data + header['arrays'][name]['offset'])
+      f.write(array.tobytes())
+  os.replace(temp, path)
+
+
+def read(path):
+  # Header and read-only arrays backed by a memory map of the file, so many
+  # processes can open the same checkpoint without copying it.
+  with open(path, 'rb') as f:
+    prefix = f.read(len(MAGIC) + 8)
+    if prefix[:len(MAGIC)] != MAGIC:
+      raise ValueError(f'Not a crafter checkpoint: {path}')
+    version, length = np.frombuffer(prefix[len(MAGIC):], '<u4').tolist()
+    if version != VERSION:
+      raise ValueError(f'Unsupported checkpoint version {version}: {path}')
+    header = json.loads(f.read(length).decode('utf-8'))
+  data = _align(len(prefix) + length)
+  buffer = np.memmap(path, np.uint8, mode='r')
+  arrays = {}
+  for name, info in header['arrays'].items():
+    dtype = np.dtype(info['dtype'])
+    begin = data + info['offset']
+    end = begin + dtype.itemsize * int(np.prod(info['shape']))
+    arrays[name] = buffer[begin: end].view(dtype).reshape(info['shape'])
+  return header, arrays
+
+
+def load(env, path):
+  header, arrays = read(path)
+  _restore(env, header, arrays)
+  # Rendering the observation can advance the noise frame and, with legacy
+  # lighting, the random state, so both are set afterwards.
+  obs = env._obs()
+  _restore_random(env._world, header, arrays)
+  env._local_view._frame = header['frame']
+  return obs
+
+
+def load_world(env, path):
+  # Swaps in the world of a checkpoint that was saved right after generation,
+  # keeping the episode counter and render state of the environment. The
+  # caller renders the first observation.
+  header, arrays = read(path)
+  episode = env._episode
+  _restore(env, header, arrays)
+  _restore_random(env._world, header, arrays)
+  env._episode = episode
+
+
+def _restore(env, header, arrays):
+  world = env._world
+  materials = [world._mat_names[i] for i in range(len(world._mat_names))]
+  if tuple(header['area']) != tuple(world.area):
+    raise ValueError(f"Checkpoint area {header['area']} != {world.area}")
+  if header['materials'] != materials:
+    raise ValueError('Checkpoint was saved with different materials.')
+  types = [getattr(objects, name) for name in header['types']]
+  world.reset(seed=0)
+  world.daylight = header['daylight']
+  world.set_materials(arrays['mat_map'])
+  for key in header['chunks']:
+    world._chunks[tuple(key)] = set()
+  columns = {
+      name[len('obj_'):]: array.tolist()
+      for name, array in arrays.items() if name.startswith('obj_')}
+  info = header['player']
+  player = objects.Player(world, columns['pos'][info['index']])
+  player.facing = tuple(columns['facing'][info['index']])
+  player.inventory.update(info['inventory'])
+  player.achievements.update(info['achievements'])
+  player.action = info['action']
+  player.sleeping = info['sleeping']
+  player._last_health = info['last_health']
+  player._hunger = info['hunger']
+  player._thirst = info['thirst']
+  player._fatigue = info['fatigue']
+  player._recover = info['recover']
+  for index, code in enumerate(columns['type']):
+    cls, pos = types[code], columns['pos'][index]
+    if index == info['index']:
+      obj = player
+    elif cls in (objects.Zombie, objects.Skeleton):
+      obj = cls(world, pos, player)
+    elif cls is objects.Arrow:
+      obj = cls(world, pos, np.array(columns['facing'][index]))
+    else:
+      obj = cls(world, pos)
+    if obj is not player:
+      obj.health = columns['health'][index]
+      for name in ('cooldown', 'reload', 'grown'):
+        if hasattr(obj, name):
+          setattr(obj, name, columns[name][index])
+    world.add(obj)
+  if 'slot' in columns:
+    world.renumber(columns['slot'], **header['slots'])
+  env._player = player
+  env._episode = header['episode']
+  env._step = header['step']
+  env._last_health = header['last_health']
+  env._unlocked = set(header['unlocked'])
+  env._balanced = {
+      tuple(entry[:4]): entry[4] for entry in header.get('balanced', [])}
+
+
+def _restore_random(world, header, arrays):
+  pos, has_gauss, cached_gaussian = header['random']
+  world.random.set_state((
+      'MT19937', np.array(arrays['random_key']), pos, has_gauss,
+      cached_gaussian))
+
+
+def _column(objs, name, dtype):
+  return np.array([getattr(obj, name, 0) for obj in objs], dtype)
+
+
+def _align(offset):
+  return -(-offset // ALIGN) * ALIGN
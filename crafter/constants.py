@@ -1,8 +1,38 @@
+import json
+import os
 import pathlib
-
-import ruamel.yaml
+import zlib
 
 root = pathlib.Path(__file__).parent
-yaml = ruamel.yaml.YAML(typ='safe', pure=True)
-for key, value in yaml.load((root / 'data.yaml').read_text()).items():
-  globals()[key] = value
\ No newline at end of file
+
+
+def _load():
+  # Parsing the YAML file is slow compared to the rest of the import, so the
+  # parsed data is cached as JSON along with a checksum of the file it came
+  # from. Editing the YAML file changes the checksum and the cache is rebuilt.
+  source = (root / 'data.yaml').read_bytes()
+  checksum = zlib.crc32(source)
+  cache = root / '__pycache__' / 'data.json'
+  try:
+    cached = json.loads(cache.read_text())
+    if cached['checksum'] == checksum:
+      return cached['data']
+  except (OSError, ValueError, KeyError, TypeError):
+    pass
+  import ruamel.yaml
+  yaml = ruamel.yaml.YAML(typ='safe', pure=True)
+  data = yaml.load(source)
+  try:
+    cache.parent.mkdir(exist_ok=True)
+    # Written next to the target and renamed, so that concurrent imports never
+    # read a partial file. The cache is skipped when the package is read-only.
+    temp = cache.with_name(f'{cache.name}.{os.getpid()}.tmp')
+    temp.write_text(json.dumps({'checksum': checksum, 'data': data}))
+    os.replace(temp, cache)
+  except OSError:
+    pass
+  return data
+
+
+for key, value in _load().items():
+  globals()[key] = value
@@ -1,10 +1,11 @@
 import collections
+import collections.abc
 import functools
+import heapq
+import itertools
 import pathlib
 
-import imageio
 import numpy as np
-from PIL import Image, ImageEnhance
 
 
 class AttrDict(dict):
@@ -21,22 +22,314 @@ class staticproperty:
     return self.function()
 
 
+class Counts(collections.abc.MutableMapping):
+
+  # Integer counts for a fixed list of names, stored in an array in the order
+  # of the names and accessed like a dict. Copies are plain dicts, while
+  # clones share the index of names, so cloning costs an array copy.
+
+  def __init__(self, names, values=0, maxima=None):
+    self._index = {name: index for index, name in enumerate(names)}
+    self.array = np.zeros(len(names), np.int64)
+    self.array[:] = values
+    self._maxima = None if maxima is None else np.array(maxima, np.int64)
+    self._copied = None, None
+
+  def __getitem__(self, name):
+    return self.array.item(self._index[name])
+
+  def __setitem__(self, name, value):
+    self.array[self._index[name]] = value
+
+  def __delitem__(self, name):
+    raise TypeError('Counts have a fixed set of names.')
+
+  def __iter__(self):
+    return iter(self._index)
+
+  def __len__(self):
+    return len(self._index)
+
+  def __repr__(self):
+    return repr(dict(zip(self._index, self.array.tolist())))
+
+  def items(self):
+    return _CountsItems(self)
+
+  def values(self):
+    return _CountsValues(self)
+
+  def copy(self):
+    # Building a dict from the array takes about 2us against 0.15us for
+    # copying one, so the last dict is kept and copied while the counts stay
+    # the same, which they do in most steps. Comparing the bytes of the array
+    # also notices writes to the array itself.
+    data = self.array.tobytes()
+    if data != self._copied[0]:
+      self._copied = data, dict(zip(self._index, self.array.tolist()))
+    return self._copied[1].copy()
+
+  def clone(self):
+    clone = object.__new__(type(self))
+    clone._index, clone._maxima = self._index, self._maxima
+    clone._copied = self._copied
+    clone.array = self.array.copy()
+    return clone
+
+  def clamp(self):
+    # Limits every count to the range from zero to its maximum at once.
+    np.minimum(self.array, self._maxima, out=self.array)
+    np.maximum(self.array, 0, out=self.array)
+
+
+class _CountsItems(collections.abc.ItemsView):
+
+  def __iter__(self):
+    return zip(self._mapping._index, self._mapping.array.tolist())
+
+
+class _CountsValues(collections.abc.ValuesView):
+
+  def __iter__(self):
+    return iter(self._mapping.array.tolist())
+
+
+# Versions are unique across all worlds so that snapshots taken on different
+# branches never compare equal by accident.
+_versions = itertools.count(1)
+
+
+class BufferedRandom:
+
+  # Mersenne Twister with the same state and sequences as RandomState, which
+  # hands out scalar draws from the tempered words of its current key instead
+  # of calling into NumPy for every number. Keys are regenerated and tempered
+  # with vectorized NumPy operations. In exact mode, draws are derived from the
+  # words the same way as RandomState derives them, so that seeded results do
+  # not change. Otherwise, every scalar uses a single word. Methods that are
+  # not implemented here run on a RandomState at the same position.
+
+  def __init__(self, seed=None, exact=True):
+    self._exact = exact
+    self._random = None
+    self.seed(seed)
+
+  def seed(self, seed=None):
+    self.set_state(np.random.RandomState(seed).get_state())
+
+  def uniform(self, low=0.0, high=1.0, size=None):
+    if not (isinstance(low, (int, float)) and isinstance(high, (int, float))):
+      return self._call('uniform', low, high, size)
+    if size is not None:
+      count = int(np.prod(size))
+      if self._exact:
+        words = self._draw(2 * count).reshape((count, 2))
+        value = ((words[:, 0] >> 5) * 67108864.0 + (words[:, 1] >> 6)) / (
+            9007199254740992.0)
+      else:
+        value = self._draw(count) / 4294967296.0
+      return low + (high - low) * value.reshape(size)
+    pos = self._pos
+    if self._words is None or pos + 2 > _MT_SIZE:
+      # The first draw from a key or a double that spans two keys.
+      if self._exact:
+        # Two words give the 53 bits of a double, as in RandomState.
+        first, second = self._next(), self._next()
+        value = ((first >> 5) * 67108864.0 + (second >> 6)) / (
+            9007199254740992.0)
+      else:
+        value = self._next() / 4294967296.0
+    elif self._exact:
+      value = self._doubles[pos]
+      self._pos = pos + 2
+    else:
+      value = self._words[pos] / 4294967296.0
+      self._pos = pos + 1
+    return low + (high - low) * value
+
+  def randint(self, low, high=None, size=None, dtype=int):
+    if high is None:
+      low, high = 0, low
+    if dtype is not int or not (
+        isinstance(low, int) and isinstance(high, int)) or (
+        high - low > 2 ** 32):
+      return self._call('randint', low, high, size, dtype)
+    if high <= low:
+      raise ValueError('high <= low')
+    bound = high - low - 1
+    if size is not None:
+      return low + self._bounded(bound, size)
+    if not bound:
+      return low
+    if not self._exact:
+      return low + (self._next() * (bound + 1) >> 32)
+    # Rejection sampling from the smallest bit mask that covers the range.
+    mask = (1 << bound.bit_length()) - 1
+    while True:
+      value = self._next() & mask
+      if value <= bound:
+        return low + value
+
+  def _bounded(self, bound, size):
+    count = int(np.prod(size))
+    if not bound:
+      return np.zeros(size, np.int64)
+    if not self._exact:
+      words = self._draw(count).astype(np.uint64)
+      return (words * np.uint64(bound + 1) >> np.uint64(32)).astype(
+          np.int64).reshape(size)
+    # Masked rejection over a block of words with room for rejections. The
+    # generator is then moved to just after the last accepted word.
+    mask = (1 << bound.bit_length()) - 1
+    saved = self._key, self._pos, self._words, self._doubles
+    extra = count // 2 + 16
+    while True:
+      values = self._draw(count + extra) & np.uint32(mask)
+      accepted = np.flatnonzero(values <= bound)
+      self._key, self._pos, self._words, self._doubles = saved
+      if len(accepted) >= count:
+        break
+      extra *= 2
+    if count:
+      self._draw(int(accepted[count - 1]) + 1)
+    return values[accepted[:count]].astype(np.int64).reshape(size)
+
+  def get_state(self, legacy=True):
+    has_gauss, cached_gaussian = self._gauss
+    if not legacy:
+      return {
+          'bit_generator': 'MT19937',
+          'state': {'key': self._key.copy(), 'pos': self._pos},
+          'has_gauss': has_gauss, 'gauss': cached_gaussian}
+    return ('MT19937', self._key.copy(), self._pos, has_gauss, cached_gaussian)
+
+  def set_state(self, state):
+    if isinstance(state, dict):
+      key, pos = state['state']['key'], state['state']['pos']
+      self._gauss = (state['has_gauss'], state['gauss'])
+    else:
+      key, pos = state[1], state[2]
+      self._gauss = tuple(state[3:5]) if len(state) > 3 else (0, 0.0)
+    self._key = np.array(key, np.uint32)
+    self._pos = int(pos)
+    self._words = None
+    self._doubles = None
+
+  def __getattr__(self, name):
+    if name.startswith('_') or not callable(
+        getattr(np.random.RandomState, name, None)):
+      raise AttributeError(name)
+    return functools.partial(self._call, name)
+
+  def _call(self, name, *args, **kwargs):
+    if self._random is None:
+      self._random = np.random.RandomState()
+    self._random.set_state(self.get_state())
+    result = getattr(self._random, name)(*args, **kwargs)
+    self.set_state(self._random.get_state())
+    return result
+
+  def _next(self):
+    if self._pos == _MT_SIZE:
+      self._twist()
+    if self._words is None:
+      self._temper()
+    self._pos += 1
+    return self._words[self._pos - 1]
+
+  def _draw(self, count):
+    parts = [np.zeros(0, np.uint32)]
+    while count:
+      if self._pos == _MT_SIZE:
+        self._twist()
+      size = min(count, _MT_SIZE - self._pos)
+      parts.append(_temper(self._key[self._pos: self._pos + size]))
+      self._pos += size
+      count -= size
+    return np.concatenate(parts)
+
+  def _temper(self):
+    # Tempered words of the current key, and the double that starts at each.
+    words = _temper(self._key)
+    self._doubles = (
+        ((words[:-1] >> 5) * 67108864.0 + (words[1:] >> 6)) /
+        9007199254740992.0).tolist()
+    self._words = words.tolist()
+
+  def _twist(self):
+    # Regenerates the key like the reference implementation. Each of the four
+    # slices only reads entries that the sequential loop would see.
+    key = self._key.copy()
+    n, m = _MT_SIZE, 397
+    for begin, end in ((0, n - m), (n - m, 2 * (n - m)), (2 * (n - m), n - 1)):
+      _twist_slice(key, begin, end, key[begin + 1: end + 1], m)
+    _twist_slice(key, n - 1, n, key[:1], m)
+    self._key = key
+    self._pos = 0
+    self._words = None
+    self._doubles = None
+
+
+_MT_SIZE = 624
+
+
+def _twist_slice(key, begin, end, following, m):
+  y = (key[begin: end] & 0x80000000) | (following & 0x7fffffff)
+  source = np.arange(begin, end) + m
+  key[begin: end] = (
+      key[source % _MT_SIZE] ^ (y >> 1) ^ ((y & 1) * np.uint32(0x9908b0df)))
+
+
+def _temper(words):
+  words = words ^ (words >> 11)
+  words ^= (words << 7) & np.uint32(0x9d2c5680)
+  words ^= (words << 15) & np.uint32(0xefc60000)
+  return words ^ (words >> 18)
+
+
 class World:
 
-  def __init__(self, area, materials, chunk_size, seed):
+  def __init__(
+      self, area, materials, chunk_size, seed, exact_random=True,
+      creature_store=None, reuse_slots=False):
     self.area = area
     self._chunk_size = chunk_size
+    self._exact_random = exact_random
+    # Factory for an optional store that keeps the state of creatures in
+    # columns. It is informed of every object that is added or removed.
+    self._creature_store = creature_store
+    # New objects take the lowest free slot when set, so that objects are no
+    # longer updated in the order they were added.
+    self._reuse_slots = reuse_slots
     self._mat_names = {i: x for i, x in enumerate([None] + materials)}
     self._mat_ids = {x: i for i, x in enumerate([None] + materials)}
+    self._sem_ids = {}
     self.reset(seed)
 
   def reset(self, seed):
-    self.random = np.random.RandomState(seed)
+    self.random = BufferedRandom(seed, self._exact_random)
+    self.creatures = self._creature_store and self._creature_store()
     self.daylight = 0.0
     self._chunks = collections.defaultdict(set)
     self._objects = [None]
+    self._free = []
+    self._holes = 0
+    # Objects that are told when another one arrives next to them, by cell.
+    self._watchers = {}
+    # Steps in which each cell was within reach of the player.
+    self._reach = np.zeros(self.area, np.int32)
+    self._reaching = None
     self._mat_map = np.zeros(self.area, np.uint8)
     self._obj_map = np.zeros(self.area, np.uint32)
+    self._sem_map = np.zeros(self.area, np.uint8)
+    self._positions = collections.defaultdict(set)
+    # Per chunk statistics for balancing: cells of each material, objects of
+    # each type, and the cached cells of a material in row-major order.
+    self._chunk_mats = self._count_chunks()
+    self._census = collections.defaultdict(int)
+    self._cells = {}
+    self._mat_version = next(_versions)
+    self._mat_saved = None
 
   @property
   def objects(self):
@@ -51,18 +344,127 @@ class World:
     assert hasattr(obj, 'pos')
     obj.pos = np.array(obj.pos)
     assert self._obj_map[tuple(obj.pos)] == 0
-    index = len(self._objects)
-    self._objects.append(obj)
+    if self._free:
+      index = heapq.heappop(self._free)
+      self._objects[index] = obj
+      self._holes -= 1
+    else:
+      index = len(self._objects)
+      self._objects.append(obj)
     self._obj_map[tuple(obj.pos)] = index
-    self._chunks[self.chunk_key(obj.pos)].add(obj)
+    self._sem_map[tuple(obj.pos)] = self._semantic_id(obj)
+    key = self.chunk_key(obj.pos)
+    self._chunks[key].add(obj)
+    self._census[key, type(obj)] += 1
+    if self.creatures:
+      self.creatures.add(obj)
+    if hasattr(obj, 'notice'):
+      self._watchers[tuple(obj.pos.tolist())] = obj
+    self._arrive(obj, obj.pos)
 
   def remove(self, obj):
     if obj.removed:
       return
-    self._objects[self._obj_map[tuple(obj.pos)]] = None
+    index = self._obj_map[tuple(obj.pos)]
+    self._objects[index] = None
     self._obj_map[tuple(obj.pos)] = 0
-    self._chunks[self.chunk_key(obj.pos)].remove(obj)
+    self._sem_map[tuple(obj.pos)] = self._mat_map[tuple(obj.pos)]
+    key = self.chunk_key(obj.pos)
+    self._chunks[key].remove(obj)
+    self._census[key, type(obj)] -= 1
     obj.removed = True
+    if self.creatures:
+      self.creatures.remove(obj)
+    self._watchers.pop(tuple(obj.pos.tolist()), None)
+    self._release([int(index)])
+
+  def remove_many(self, objs):
+    objs = [obj for obj in objs if not obj.removed]
+    if not objs:
+      return
+    xs, ys = np.array([obj.pos for obj in objs]).reshape(-1, 2).T
+    indices = self._obj_map[xs, ys].tolist()
+    for index in indices:
+      self._objects[index] = None
+    self._obj_map[xs, ys] = 0
+    self._sem_map[xs, ys] = self._mat_map[xs, ys]
+    for obj in objs:
+      key = self.chunk_key(obj.pos)
+      self._chunks[key].remove(obj)
+      self._census[key, type(obj)] -= 1
+      obj.removed = True
+      if self.creatures:
+        self.creatures.remove(obj)
+      self._watchers.pop(tuple(obj.pos.tolist()), None)
+    self._release(indices)
+
+  def compact(self):
+    # Drops the empty slots and renumbers the objects in the same order, so
+    # the update order stays the same.
+    indices = [i for i, obj in enumerate(self._objects) if obj]
+    remap = np.zeros(len(self._objects), self._obj_map.dtype)
+    remap[indices] = np.arange(1, len(indices) + 1)
+    self._obj_map[:] = remap[self._obj_map]
+    self._objects = [None] + [self._objects[i] for i in indices]
+    self._free = []
+    self._holes = 0
+
+  def renumber(self, slots, size, free, holes):
+    # Moves the objects, in their current order, into the given slots of a
+    # table of the given size, with the given free slots, such as those of a
+    # saved world.
+    objs = self.objects
+    self._objects = [None] * size
+    for obj, slot in zip(objs, slots):
+      self._objects[slot] = obj
+      self._obj_map[tuple(obj.pos)] = slot
+    self._free = list(free)
+    self._holes = holes
+
+  def reach(self, obj, distance):
+    # The cells closer to the object than the distance are reached in the
+    # current step, measured from where the object is when the step is
+    # settled. The step counts towards reached() from then on.
+    self._reaching = obj, distance
+
+  def settle(self):
+    if self._reaching:
+      obj, distance = self._reaching
+      x, y = obj.pos.tolist()
+      d = distance - 1
+      xmin, xmax = max(0, x - d), min(self.area[0], x + d + 1)
+      ymin, ymax = max(0, y - d), min(self.area[1], y + d + 1)
+      self._reach[xmin: xmax, ymin: ymax] += _diamond(d)[
+          xmin - x + d: xmax - x + d, ymin - y + d: ymax - y + d]
+      self._reaching = None
+
+  def reached(self, pos, current=False):
+    # Number of settled steps in which the cell was reached, including the
+    # current step if requested.
+    count = int(self._reach[pos[0], pos[1]])
+    if current and self._reaching:
+      obj, distance = self._reaching
+      count += int(abs(pos - obj.pos).sum() < distance)
+    return count
+
+  def _arrive(self, obj, pos):
+    if not self._watchers:
+      return
+    x, y = int(pos[0]), int(pos[1])
+    for cell in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+      watcher = self._watchers.get(cell)
+      if watcher:
+        watcher.notice(obj)
+
+  def _release(self, indices):
+    # Empty slots are reused or, once they make up half of the table,
+    # compacted away.
+    self._holes += len(indices)
+    if self._reuse_slots:
+      for index in indices:
+        heapq.heappush(self._free, index)
+    if self._holes > max(64, len(self._objects) // 2):
+      self.compact()
 
   def move(self, obj, pos):
     if obj.removed:
@@ -72,18 +474,85 @@ class World:
     index = self._obj_map[tuple(obj.pos)]
     self._obj_map[tuple(pos)] = index
     self._obj_map[tuple(obj.pos)] = 0
+    self._sem_map[tuple(pos)] = self._sem_map[tuple(obj.pos)]
+    self._sem_map[tuple(obj.pos)] = self._mat_map[tuple(obj.pos)]
     old_chunk = self.chunk_key(obj.pos)
     new_chunk = self.chunk_key(pos)
     if old_chunk != new_chunk:
       self._chunks[old_chunk].remove(obj)
       self._chunks[new_chunk].add(obj)
+      self._census[old_chunk, type(obj)] -= 1
+      self._census[new_chunk, type(obj)] += 1
     obj.pos = pos
+    self._arrive(obj, pos)
+
+  def move_many(self, objs, targets):
+    # Moves objects at once. The targets must be free and distinct after all
+    # moves, as they are for moves that succeed one after another.
+    targets = np.asarray(targets)
+    sources = np.array([obj.pos for obj in objs]).reshape(-1, 2)
+    (sx, sy), (tx, ty) = sources.T, targets.T
+    indices = self._obj_map[sx, sy]
+    sem = self._sem_map[sx, sy]
+    self._obj_map[sx, sy] = 0
+    self._sem_map[sx, sy] = self._mat_map[sx, sy]
+    self._obj_map[tx, ty] = indices
+    self._sem_map[tx, ty] = sem
+    csx, csy = self._chunk_size
+    crossed = (sx // csx != tx // csx) | (sy // csy != ty // csy)
+    for index in np.flatnonzero(crossed).tolist():
+      obj = objs[index]
+      old_chunk = self.chunk_key(sources[index])
+      new_chunk = self.chunk_key(targets[index])
+      self._chunks[old_chunk].remove(obj)
+      self._chunks[new_chunk].add(obj)
+      self._census[old_chunk, type(obj)] -= 1
+      self._census[new_chunk, type(obj)] += 1
+    for obj, target in zip(objs, targets):
+      obj.pos = target
+      self._arrive(obj, target)
 
   def __setitem__(self, pos, material):
     if material not in self._mat_ids:
       id_ = len(self._mat_ids)
       self._mat_ids[material] = id_
-    self._mat_map[tuple(pos)] = self._mat_ids[material]
+    pos = int(pos[0]), int(pos[1])
+    old, new = int(self._mat_map[pos]), self._mat_ids[material]
+    if old != new:
+      # Positions are indexed for all materials except the empty id zero.
+      if old:
+        self._positions[old].remove(pos)
+      if new:
+        self._positions[new].add(pos)
+      cx, cy = pos[0] // self._chunk_size[0], pos[1] // self._chunk_size[1]
+      if new >= self._chunk_mats.shape[2]:
+        self._chunk_mats = np.pad(
+            self._chunk_mats,
+            [(0, 0), (0, 0), (0, new + 1 - self._chunk_mats.shape[2])])
+      self._chunk_mats[cx, cy, old] -= 1
+      self._chunk_mats[cx, cy, new] += 1
+      self._cells.pop((cx, cy, old), None)
+      self._cells.pop((cx, cy, new), None)
+    self._mat_map[pos] = new
+    self._mat_version = next(_versions)
+    if not self._obj_map[pos]:
+      self._sem_map[pos] = new
+
+  def set_materials(self, mat_map):
+    # Replaces the whole material layer at once and rebuilds the state that is
+    # derived from it.
+    np.copyto(self._mat_map, mat_map)
+    self._positions = collections.defaultdict(set)
+    for id_ in np.unique(self._mat_map).tolist():
+      if id_:
+        xs, ys = np.nonzero(self._mat_map == id_)
+        self._positions[id_] = set(zip(xs.tolist(), ys.tolist()))
+    self._chunk_mats = self._count_chunks()
+    self._cells = {}
+    np.copyto(self._sem_map, self._mat_map)
+    for obj in self.objects:
+      self._sem_map[tuple(obj.pos)] = self._semantic_id(obj)
+    self._mat_version = next(_versions)
 
   def __getitem__(self, pos):
     if not _inside((0, 0), pos, self.area):
@@ -92,6 +561,21 @@ class World:
     obj = self._objects[self._obj_map[tuple(pos)]]
     return material, obj
 
+  def material_id_at(self, pos):
+    # Id of the material at a position, which is zero outside the world.
+    x, y = pos.tolist() if isinstance(pos, np.ndarray) else pos
+    if 0 <= x < self.area[0] and 0 <= y < self.area[1]:
+      return self._mat_map.item(x, y)
+    return 0
+
+  def obj_index_at(self, pos):
+    # Index of the object at a position in the object list, which is zero for
+    # empty cells and outside the world.
+    x, y = pos.tolist() if isinstance(pos, np.ndarray) else pos
+    if 0 <= x < self.area[0] and 0 <= y < self.area[1]:
+      return self._obj_map.item(x, y)
+    return 0
+
   def nearby(self, pos, distance):
     (x, y), d = pos, distance
     ids = set(self._mat_map[
@@ -102,17 +586,220 @@ class World:
     objs = {self._objects[i] for i in indices if i > 0}
     return materials, objs
 
+  def objects_within(self, xmin, xmax, ymin, ymax):
+    region = self._obj_map[xmin: xmax, ymin: ymax]
+    xs, ys = np.nonzero(region)
+    return [self._objects[index] for index in region[xs, ys].tolist()]
+
+  def cells_of(self, cells, materials):
+    # Whether each cell of an array of positions is inside the world and of
+    # one of the materials, given by name or as a boolean table by id.
+    cells = np.asarray(cells).reshape(-1, 2)
+    inside = ((cells >= 0) & (cells < self.area)).all(1)
+    xs, ys = np.where(inside[:, None], cells, 0).T
+    if isinstance(materials, np.ndarray) and materials.dtype == bool:
+      allowed = materials
+    else:
+      allowed = np.zeros(len(self._mat_names), bool)
+      allowed[[self._mat_ids[name] for name in materials]] = True
+    return inside & allowed[self._mat_map[xs, ys]]
+
+  def occupants(self, cells):
+    # Object at each cell of an array of positions, or None.
+    cells = np.asarray(cells).reshape(-1, 2)
+    inside = ((cells >= 0) & (cells < self.area)).all(1)
+    xs, ys = np.where(inside[:, None], cells, 0).T
+    indices = np.where(inside, self._obj_map[xs, ys], 0)
+    return [self._objects[index] for index in indices.tolist()]
+
+  def occupied(self, cells):
+    # Whether each cell of an array of positions holds an object.
+    cells = np.asarray(cells).reshape(-1, 2)
+    inside = ((cells >= 0) & (cells < self.area)).all(1)
+    xs, ys = np.where(inside[:, None], cells, 0).T
+    return inside & (self._obj_map[xs, ys] > 0)
+
   def mask(self, xmin, xmax, ymin, ymax, material):
     region = self._mat_map[xmin: xmax, ymin: ymax]
     return (region == self._mat_ids[material])
 
   def count(self, material):
-    return (self._mat_map == self._mat_ids[material]).sum()
-  
+    id_ = self._mat_ids[material]
+    if not id_:
+      return (self._mat_map == id_).sum()
+    return len(self._positions[id_])
+
   def location(self, material):
-    x_indices, y_indices = np.where(self._mat_map == self._mat_ids[material])
-    coordinates = list(zip(x_indices, y_indices))
-    return coordinates
+    id_ = self._mat_ids[material]
+    if not id_:
+      x_indices, y_indices = np.where(self._mat_map == id_)
+      return list(zip(x_indices.tolist(), y_indices.tolist()))
+    return sorted(self._positions[id_])
+
+  def nearest(self, material, pos, max_dist=None):
+    # Closest position of the material by Manhattan distance, with ties broken
+    # by position, or None if there is none within max_dist.
+    id_ = self._mat_ids.get(material)
+    if not id_:
+      return None
+    (x, y), positions = pos, self._positions[id_]
+    if max_dist is not None and (2 * max_dist + 1) ** 2 < len(positions):
+      xmin, ymin = max(0, x - max_dist), max(0, y - max_dist)
+      region = self._mat_map[
+          xmin: x + max_dist + 1, ymin: y + max_dist + 1] == id_
+      xs, ys = np.nonzero(region)
+      positions = zip((xs + xmin).tolist(), (ys + ymin).tolist())
+    best, best_dist = None, None
+    for target in positions:
+      dist = abs(target[0] - x) + abs(target[1] - y)
+      if best is None or (dist, target) < (best_dist, best):
+        best, best_dist = target, dist
+    if best is None or (max_dist is not None and best_dist > max_dist):
+      return None
+    return best
+
+  def objects_near(self, pos, distance):
+    # Only visit the chunks that overlap the square around the position and
+    # return the objects in the same order as the objects property.
+    (x, y), (csx, csy) = pos, self._chunk_size
+    xmin, xmax = max(0, x - distance), min(self.area[0] - 1, x + distance)
+    ymin, ymax = max(0, y - distance), min(self.area[1] - 1, y + distance)
+    found = []
+    for cx in range((xmin // csx) * csx, xmax + 1, csx):
+      for cy in range((ymin // csy) * csy, ymax + 1, csy):
+        for obj in self._chunks.get(self.chunk_key((cx, cy)), ()):
+          if abs(obj.pos[0] - x) + abs(obj.pos[1] - y) <= distance:
+            found.append(obj)
+    found.sort(key=lambda obj: self._obj_map[obj.pos[0], obj.pos[1]])
+    return found
+
+  def chunks_near(self, pos, distance):
+    # Keys of the known chunks that overlap the square around the position,
+    # ordered by their location.
+    (x, y), (csx, csy) = pos, self._chunk_size
+    xmin, xmax = max(0, x - distance), min(self.area[0] - 1, x + distance)
+    ymin, ymax = max(0, y - distance), min(self.area[1] - 1, y + distance)
+    found = []
+    for cx in range(int(xmin // csx) * csx, int(xmax) + 1, csx):
+      for cy in range(int(ymin // csy) * csy, int(ymax) + 1, csy):
+        key = self.chunk_key((cx, cy))
+        if key in self._chunks:
+          found.append(key)
+    return found
+
+  def snapshot(self):
+    # The material layer is copied only when it changed since the previous
+    # snapshot and is shared between snapshots otherwise.
+    if not self._mat_saved or self._mat_saved[0] != self._mat_version:
+      self._mat_saved = (
+          self._mat_version, _frozen(self._mat_map),
+          {k: frozenset(v) for k, v in self._positions.items()},
+          _frozen(self._chunk_mats))
+    return dict(
+        random=self.random,
+        random_state=self.random.get_state(),
+        daylight=self.daylight,
+        materials=self._mat_saved,
+        mat_ids=self._mat_ids.copy(),
+        obj_map=_frozen(self._obj_map),
+        sem_map=_frozen(self._sem_map),
+        reach=_frozen(self._reach),
+        reaching=self._reaching,
+        watchers=dict(self._watchers),
+        objects=tuple(self._objects),
+        free=tuple(self._free),
+        holes=self._holes,
+        chunks={k: frozenset(v) for k, v in self._chunks.items()},
+        census=dict(self._census),
+        creatures=self.creatures and (
+            self.creatures, self.creatures.snapshot()),
+        attrs=[(obj, _attrs(obj)) for obj in self._objects if obj])
+
+  def restore(self, state):
+    self.random = state['random']
+    self.random.set_state(state['random_state'])
+    self.daylight = state['daylight']
+    version, mat_map, positions, chunk_mats = state['materials']
+    if self._mat_version != version:
+      np.copyto(self._mat_map, mat_map)
+      self._positions = collections.defaultdict(
+          set, {k: set(v) for k, v in positions.items()})
+      self._chunk_mats = chunk_mats.copy()
+      self._cells = {}
+      self._mat_version = version
+    self._mat_saved = state['materials']
+    self._mat_ids = state['mat_ids'].copy()
+    np.copyto(self._obj_map, state['obj_map'])
+    np.copyto(self._sem_map, state['sem_map'])
+    np.copyto(self._reach, state['reach'])
+    self._reaching = state['reaching']
+    self._watchers = dict(state['watchers'])
+    self._objects = list(state['objects'])
+    self._free = list(state['free'])
+    self._holes = state['holes']
+    self._chunks = collections.defaultdict(
+        set, {k: set(v) for k, v in state['chunks'].items()})
+    self._census = collections.defaultdict(int, state['census'])
+    self.creatures = None
+    if state['creatures']:
+      self.creatures, creatures = state['creatures']
+      self.creatures.restore(creatures)
+    for obj, attrs in state['attrs']:
+      obj.__dict__.clear()
+      obj.__dict__.update(_attrs(attrs))
+
+  def track_semantic(self, obj_ids):
+    # The semantic map shows the material ids with the ids of the given object
+    # types on top and is kept up to date by every world mutation.
+    self._sem_ids = dict(obj_ids)
+    self._sem_map = self._mat_map.copy()
+    for obj in self.objects:
+      self._sem_map[tuple(obj.pos)] = self._semantic_id(obj)
+
+  def _chunk_index(self, chunk):
+    return chunk[0] // self._chunk_size[0], chunk[2] // self._chunk_size[1]
+
+  def _count_chunks(self):
+    # Number of cells of every material in every chunk.
+    (csx, csy), (w, h) = self._chunk_size, self.area
+    shape = (
+        -(-w // csx), -(-h // csy),
+        max(len(self._mat_ids), int(self._mat_map.max()) + 1))
+    xs = np.arange(w)[:, None] // csx
+    ys = np.arange(h)[None, :] // csy
+    index = (xs * shape[1] + ys) * shape[2] + self._mat_map
+    counts = np.bincount(index.ravel(), minlength=int(np.prod(shape)))
+    return counts.reshape(shape)
+
+  def _semantic_id(self, obj):
+    return self._sem_ids.get(type(obj), self._mat_map[tuple(obj.pos)])
+
+  def chunk_space(self, chunk, material):
+    # Number of cells of the material in the chunk.
+    id_, index = self._mat_ids[material], self._chunk_index(chunk)
+    if id_ >= self._chunk_mats.shape[2]:
+      return 0
+    return int(self._chunk_mats[index + (id_,)])
+
+  def chunk_cells(self, chunk, material):
+    # Cells of the material in the chunk in row-major order, cached until a
+    # cell of the chunk changes from or to the material.
+    key = self._chunk_index(chunk) + (self._mat_ids[material],)
+    if key not in self._cells:
+      xs, ys = np.nonzero(self.mask(*chunk, material))
+      self._cells[key] = list(zip(
+          (xs + chunk[0]).tolist(), (ys + chunk[2]).tolist()))
+    return self._cells[key]
+
+  def chunk_population(self, chunk, cls):
+    # Number of objects of exactly the given type in the chunk.
+    return self._census.get((chunk, cls), 0)
+
+  def chunk_members(self, chunk, cls):
+    # Objects of exactly the given type in the chunk, in update order.
+    found = [obj for obj in self._chunks.get(chunk, ()) if type(obj) is cls]
+    found.sort(key=lambda obj: self._obj_map[obj.pos[0], obj.pos[1]])
+    return found
 
   def chunk_key(self, pos):
     (x, y), (csx, csy) = pos, self._chunk_size
@@ -124,14 +811,45 @@ class World:
 
 class Textures:
 
+  _shared = {}
+
   def __init__(self, directory):
+    # Images are only decoded when a texture is first needed.
+    self._paths = {
+        filename.stem: filename
+        for filename in pathlib.Path(directory).glob('*.png')}
     self._originals = {}
     self._textures = {}
-    for filename in pathlib.Path(directory).glob('*.png'):
-      image = imageio.imread(filename.read_bytes())
-      image = image.transpose((1, 0) + tuple(range(2, len(image.shape))))
-      self._originals[filename.stem] = image
-      self._textures[(filename.stem, image.shape[:2])] = image
+    self._atlases = {}
+    self._sprites = {}
+
+  @classmethod
+  def shared(cls, directory, sizes=()):
+    # Textures are read-only, so one instance per directory can serve all
+    # environments of a process. Creating and pre-warming it before forking
+    # workers lets them use the same memory pages.
+    key = str(pathlib.Path(directory).resolve())
+    if key not in cls._shared:
+      cls._shared[key] = cls(directory)
+    textures = cls._shared[key]
+    textures.prewarm(sizes)
+    return textures
+
+  def prewarm(self, sizes):
+    # Resize all textures for each unit size and pack them into one contiguous
+    # block, instead of many small allocations scattered over the heap.
+    for size in sizes:
+      size = int(size[0]), int(size[1])
+      names = [n for n in self._paths if (n, size) not in self._textures]
+      images = [self._resize(name, size) for name in names]
+      block = np.empty(sum(image.size for image in images), np.uint8)
+      start = 0
+      for name, image in zip(names, images):
+        texture = block[start: start + image.size].reshape(image.shape)
+        texture[:] = image
+        texture.flags.writeable = False
+        self._textures[(name, size)] = texture
+        start += image.size
 
   def get(self, name, size):
     if name is None:
@@ -139,13 +857,59 @@ class Textures:
     size = int(size[0]), int(size[1])
     key = name, size
     if key not in self._textures:
-      image = self._originals[name]
-      image = Image.fromarray(image)
-      image = image.resize(size[::-1], resample=Image.NEAREST)
-      image = np.array(image)
+      image = self._resize(name, size)
+      image.flags.writeable = False
       self._textures[key] = image
     return self._textures[key]
 
+  def _original(self, name):
+    if name not in self._originals:
+      # Imaging libraries are imported on first use, which keeps importing
+      # the package fast for processes that never render.
+      from PIL import Image
+      image = Image.open(self._paths[name])
+      if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+      image = np.asarray(image)
+      image = image.transpose((1, 0) + tuple(range(2, len(image.shape))))
+      image.flags.writeable = False
+      self._originals[name] = image
+    return self._originals[name]
+
+  def _resize(self, name, size):
+    from PIL import Image
+    image = self._original(name)
+    if image.shape[:2] == size:
+      return image
+    image = Image.fromarray(image)
+    image = image.resize(size[::-1], resample=Image.NEAREST)
+    return np.array(image)
+
+  def atlas(self, names, size):
+    # Opaque tiles for the names stacked along the first axis, followed by a
+    # gray tile for cells that lie outside of the world.
+    size = int(size[0]), int(size[1])
+    key = tuple(names), size
+    if key not in self._atlases:
+      tiles = [self.get(name, size)[..., :3] for name in names]
+      tiles.append(np.full(size + (3,), 127, np.uint8))
+      atlas = np.stack(tiles)
+      atlas.flags.writeable = False
+      self._atlases[key] = atlas
+    return self._atlases[key]
+
+  def sprite(self, name, background, size):
+    # Texture alpha-composited onto an opaque background tile, which is what
+    # drawing an object on top of its material produces.
+    size = int(size[0]), int(size[1])
+    key = name, background, size
+    if key not in self._sprites:
+      canvas = self.get(background, size)[..., :3].copy()
+      _draw_alpha(canvas, (0, 0), self.get(name, size))
+      canvas.flags.writeable = False
+      self._sprites[key] = canvas
+    return self._sprites[key]
+
 
 class GlobalView:
 
@@ -159,48 +923,97 @@ class UncoverView:
 
 class LocalView:
 
-  def __init__(self, world, textures, grid):
+  def __init__(self, world, textures, grid, legacy_light=False):
     self._world = world
     self._textures = textures
     self._grid = np.array(grid)
     self._offset = self._grid // 2
     self._area = np.array(self._world.area)
     self._center = None
+    self._legacy_light = legacy_light
+    self._frame = 0
 
   def __call__(self, player, unit):
     self._unit = np.array(unit)
-    self._center = np.array(player.pos)
-    canvas = np.zeros(tuple(self._grid * unit) + (3,), np.uint8) + 127
+    (gx, gy), (ux, uy) = self._grid, self._unit
+    names, ids, objs = self._visible(player)
+    atlas = self._textures.atlas(names, self._unit)
+    canvas = atlas[ids].transpose((0, 2, 1, 3, 4))
+    canvas = canvas.reshape((gx * ux, gy * uy, 3))
+    for pos, obj in objs:
+      sprite = self._textures.sprite(obj.texture, names[ids[tuple(pos)]], unit)
+      _draw(canvas, pos * unit, sprite)
+    text_frame = self._text_frame(names, ids, objs)
 
-    text_frame = [['grass' for _ in range(7)] for _ in range(9)]
+    if self._legacy_light:
+      canvas = self._light(canvas, self._world.daylight)
+      if player.sleeping:
+        canvas = self._sleep(canvas)
+    else:
+      canvas = self._shade(canvas, self._world.daylight, player.sleeping)
+    # if player.health < 1:
+    #   canvas = self._tint(canvas, (128, 0, 0), 0.6)
 
-    for x in range(self._grid[0]):
-      for y in range(self._grid[1]):
-        pos = self._center + np.array([x, y]) - self._offset
-        if not _inside((0, 0), pos, self._area):
-          continue
-        texture = self._textures.get(self._world[pos][0], unit)
-        text_frame[x][y] = self._world[pos][0]
-        _draw(canvas, np.array([x, y]) * unit, texture)
+    return canvas, text_frame
 
+  def text(self, player):
+    # Text frame of the view without drawing any pixels.
+    return self._text_frame(*self._visible(player))
 
-    for obj in self._world.objects:
-      pos = obj.pos - self._center + self._offset
-      if not _inside((0, 0), pos, self._grid):
-        continue
+  def _visible(self, player):
+    self._center = np.array(player.pos)
+    gx, gy = self._grid
+    mat_names = self._world._mat_names
+    names = [mat_names[i] for i in range(len(mat_names))]
+    # Material ids of the visible cells, where the extra last index refers to
+    # the gray tile for cells outside of the world.
+    ids = np.full((gx, gy), len(names), np.intp)
+    x0, y0 = self._center - self._offset
+    xmin, ymin = max(0, x0), max(0, y0)
+    xmax, ymax = min(self._area[0], x0 + gx), min(self._area[1], y0 + gy)
+    if xmin < xmax and ymin < ymax:
+      ids[xmin - x0: xmax - x0, ymin - y0: ymax - y0] = (
+          self._world._mat_map[xmin: xmax, ymin: ymax])
+    objs = [
+        (obj.pos - self._center + self._offset, obj)
+        for obj in self._world.objects_within(xmin, xmax, ymin, ymax)]
+    return names, ids, objs
+
+  def _text_frame(self, names, ids, objs):
+    labels = names + ['grass']
+    text_frame = [[labels[i] for i in row] for row in ids.tolist()]
+    for pos, obj in objs:
       text_frame[pos[0]][pos[1]] = obj.texture
-      texture = self._textures.get(obj.texture, unit)
-      _draw_alpha(canvas, pos * unit, texture)
-      
-    canvas = self._light(canvas, self._world.daylight)
-    if player.sleeping:
-      canvas = self._sleep(canvas)
-    # if player.health < 1:
-    #   canvas = self._tint(canvas, (128, 0, 0), 0.6)
+    return text_frame
 
-    return canvas, text_frame
+  def _shade(self, canvas, daylight, sleeping):
+    # Lighting and sleeping are affine color transforms, except for the night
+    # noise, which comes from a fixed bank so rendering does not consume the
+    # random state of the world.
+    level = int(round(daylight * _LIGHT_LEVELS))
+    if level == _LIGHT_LEVELS and not sleeping:
+      return canvas
+    matrix, offset, noise_matrix, noise_gain = _shading(level, sleeping)
+    pixels = canvas.astype(np.float32)
+    shaded = pixels @ matrix.T + offset
+    if level < _LIGHT_LEVELS / 2:
+      amount = 2 * (0.5 - level / _LIGHT_LEVELS)
+      vignette, noise = self._noise_bank(canvas.shape[:2], 0.5)
+      noise = noise[self._frame % len(noise)]
+      self._frame += 1
+      shaded += amount * noise[..., None] * noise_gain
+      shaded -= amount * vignette[..., None] * (pixels @ noise_matrix.T)
+    return np.clip(shaded, 0, 255, out=shaded).astype(np.uint8)
+
+  @functools.lru_cache(4)
+  def _noise_bank(self, shape, stddev):
+    vignette = self._vignette(shape + (3,), stddev).astype(np.float32)
+    random = np.random.RandomState(0)
+    noise = random.uniform(32, 127, (_NOISE_FRAMES,) + shape)
+    return vignette, (vignette * noise).astype(np.float32)
 
   def _light(self, canvas, daylight):
+    from PIL import Image, ImageEnhance
     night = canvas
     if daylight < 0.5:
       night = self._noise(night, 2 * (0.5 - daylight), 0.5)
@@ -210,6 +1023,7 @@ class LocalView:
     return daylight * canvas + (1 - daylight) * night
 
   def _sleep(self, canvas):
+    from PIL import Image, ImageEnhance
     canvas = np.array(ImageEnhance.Color(
         Image.fromarray(canvas.astype(np.uint8))).enhance(0.0))
     canvas = self._tint(canvas, (0, 0, 16), 0.5)
@@ -232,6 +1046,34 @@ class LocalView:
     return 1 - np.exp(-0.5 * (xs ** 2 + ys ** 2) / (stddev ** 2)).T
 
 
+_LIGHT_LEVELS = 64
+_NOISE_FRAMES = 8
+
+
+@functools.lru_cache(2 * (_LIGHT_LEVELS + 1))
+def _shading(level, sleeping):
+  # Folds the desaturation and tinting of the day/night cycle and of sleeping
+  # into one matrix and offset for the given quantized daylight level. The
+  # noise terms pass through the same transforms.
+  luma = np.array([0.299, 0.587, 0.114])
+  desaturate = lambda amount: (
+      amount * np.eye(3) + (1 - amount) * np.ones((3, 1)) * luma)
+  daylight = level / _LIGHT_LEVELS
+  night = 0.5 * (1 - daylight)
+  matrix = daylight * np.eye(3) + night * desaturate(0.4)
+  offset = night * np.array([0, 16, 64])
+  noise_matrix = night * desaturate(0.4)
+  noise_gain = night * np.ones(3)
+  if sleeping:
+    sleep = 0.5 * desaturate(0.0)
+    matrix = sleep @ matrix
+    offset = sleep @ offset + 0.5 * np.array([0, 0, 16])
+    noise_matrix = sleep @ noise_matrix
+    noise_gain = sleep @ noise_gain
+  return tuple(x.astype(np.float32) for x in (
+      matrix, offset, noise_matrix, noise_gain))
+
+
 class ItemView:
 
   def __init__(self, textures, grid):
@@ -270,14 +1112,37 @@ class SemanticView:
     self._obj_ids = {
         c: len(self._mat_ids) + i
         for i, c in enumerate(obj_types)}
+    world.track_semantic(self._obj_ids)
 
-  def __call__(self):
-    canvas = self._world._mat_map.copy()
-    for obj in self._world.objects:
-      canvas[tuple(obj.pos)] = self._obj_ids[type(obj)]
+  def __call__(self, copy=False):
+    # The world maintains the semantic map, so by default this returns a
+    # read-only view of it that changes as the world changes.
+    if copy:
+      return self._world._sem_map.copy()
+    canvas = self._world._sem_map.view()
+    canvas.flags.writeable = False
     return canvas
 
 
+@functools.lru_cache()
+def _diamond(radius):
+  offsets = np.abs(np.arange(-radius, radius + 1))
+  return (offsets[:, None] + offsets[None, :] <= radius).astype(np.int32)
+
+def _frozen(array):
+  array = array.copy()
+  array.flags.writeable = False
+  return array
+
+def _attrs(obj):
+  # Copy of the attributes of an object or of such a copy. Containers that are
+  # mutated in place, like the inventory, are copied one level deep.
+  attrs = obj if isinstance(obj, dict) else obj.__dict__
+  return {
+      k: v.clone() if isinstance(v, Counts) else
+      v.copy() if isinstance(v, (dict, set, list)) else v
+      for k, v in attrs.items()}
+
 def _inside(lhs, mid, rhs):
   return (lhs[0] <= mid[0] < rhs[0]) and (lhs[1] <= mid[1] < rhs[1])
 
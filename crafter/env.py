@@ -1,7 +1,9 @@
 import collections
+import functools
 
 import numpy as np
 
+from . import checkpoint
 from . import constants
 from . import engine
 from . import objects
@@ -23,12 +25,22 @@ except ImportError:
   DictSpace = collections.namedtuple('DictSpace', 'spaces')
   BaseClass = object
 
+# Most balancing rounds that a dormant chunk replays when it wakes up.
+_CATCHUP_ROUNDS = 5
+_INFO_KEYS = (
+    'inventory', 'achievements', 'discount', 'semantic', 'player_pos',
+    'reward')
+
 
 class Env(BaseClass):
 
   def __init__(
       self, area=(64, 64), view=(9, 9), size=(64, 64),
-      reward=True, length=10000, seed=0, object_dict_path='../crafter_env/objects.json'):
+      reward=True, length=10000, seed=0, object_dict_path='../crafter_env/objects.json',
+      legacy_light=False, observation='pixels', exact_worldgen=True,
+      prefetch=False, world_pool=None, pool_capacity=256, exact_random=True,
+      active_radius=None, batched_creatures=False, batched_arrows=False,
+      reuse_slots=False, info_keys=None):
     view = np.array(view if hasattr(view, '__len__') else (view, view))
     size = np.array(size if hasattr(size, '__len__') else (size, size))
     self._area = area
@@ -38,11 +50,60 @@ class Env(BaseClass):
     self._length = length
     self._seed = seed
     self._episode = 0
-    self._world = engine.World(area, constants.materials, (12, 12), self._seed)
-    self._textures = engine.Textures(constants.root / 'assets')
+    # Exact generation reproduces the worlds of earlier versions for a seed,
+    # the fast one samples worlds from the same distribution in less time.
+    self._exact_worldgen = exact_worldgen
+    # Exact random draws match the sequences of RandomState for the seed, the
+    # fast ones use fewer bits per draw.
+    self._exact_random = exact_random
+    # Only chunks within this distance of the player are balanced when set.
+    # The others stay dormant and catch up on missed rounds when they wake.
+    self._active_radius = active_radius
+    self._balanced = None
+    # Worlds can be generated ahead in a background worker and kept in a
+    # bounded pool of checkpoints, optionally in a directory that persists.
+    self._pool = None
+    if prefetch or world_pool:
+      # Imported here since it pulls in multiprocessing.
+      from . import pool
+      self._pool = pool.WorldPool(
+          type(self), dict(
+              area=tuple(area), exact_worldgen=exact_worldgen,
+              exact_random=exact_random),
+          world_pool, pool_capacity, prefetch)
+    # Any of 'pixels', 'text' and 'semantic'. A single mode returns its value
+    # as the observation, several modes return a dict keyed by mode.
+    self._modes = (
+        (observation,) if isinstance(observation, str) else tuple(observation))
+    assert set(self._modes) <= {'pixels', 'text', 'semantic'}, self._modes
+    # Keys of the info dict that step fills in, all of them by default. Loops
+    # that ignore the info dict can pass an empty tuple to skip copying the
+    # inventory and achievements and the semantic map every step. Recording
+    # needs the inventory, achievements and reward.
+    info_keys = _INFO_KEYS if info_keys is None else tuple(info_keys)
+    unknown = [key for key in info_keys if key not in _INFO_KEYS]
+    if unknown:
+      raise ValueError(f'Unknown info keys {unknown}, use any of {_INFO_KEYS}.')
+    self._info_keys = tuple(key for key in _INFO_KEYS if key in info_keys)
+    # Batched creatures and arrows keep their state in arrays and are updated
+    # together per type after the other objects. Random draws and collisions
+    # then happen in a different order than with one update after another,
+    # so episodes differ for the same seed. Reusing the slots of removed
+    # objects changes the update order as well.
+    batched = []
+    if batched_creatures:
+      batched += [objects.Zombie, objects.Skeleton, objects.Cow]
+    if batched_arrows:
+      batched.append(objects.Arrow)
+    store = batched and functools.partial(objects.CreatureStore, batched)
+    self._world = engine.World(
+        area, constants.materials, (12, 12), self._seed, exact_random,
+        store or None, reuse_slots)
+    self._textures = engine.Textures.shared(constants.root / 'assets')
     item_rows = int(np.ceil(len(constants.items) / view[0]))
     self._local_view = engine.LocalView(
-        self._world, self._textures, [view[0], view[1] - item_rows])
+        self._world, self._textures, [view[0], view[1] - item_rows],
+        legacy_light)
     self._item_view = engine.ItemView(
         self._textures, [view[0], item_rows])
     self._sem_view = engine.SemanticView(self._world, [
@@ -61,7 +122,20 @@ class Env(BaseClass):
 
   @property
   def observation_space(self):
-    return BoxSpace(0, 255, tuple(self._size) + (3,), np.uint8)
+    # The text frame is a grid of strings, which no box space describes.
+    if 'text' in self._modes:
+      raise ValueError(
+          'Text observations have no observation space, use pixels or '
+          'semantic observations instead.')
+    spaces = {
+        'pixels': BoxSpace(0, 255, tuple(self._size) + (3,), np.uint8),
+        'semantic': BoxSpace(
+            0, max(self._sem_view._obj_ids.values()),
+            tuple(self._area), np.uint8),
+    }
+    if len(self._modes) == 1:
+      return spaces[self._modes[0]]
+    return DictSpace({k: spaces[k] for k in self._modes})
 
   @property
   def action_space(self):
@@ -72,32 +146,48 @@ class Env(BaseClass):
     return constants.actions
 
   def reset(self):
-    center = (self._world.area[0] // 2, self._world.area[1] // 2)
     self._episode += 1
-    self._step = 0
-    self._world.reset(seed=hash((self._seed, self._episode)) % (2 ** 31 - 1))
-    self._update_time()
-    self._player = objects.Player(self._world, center)
-    self._last_health = self._player.health
-    self._world.add(self._player)
-    self._unlocked = set()
-    worldgen.generate_world(self._world, self._player)
+    seed = self._world_seed(self._episode)
+    if self._pool is not None:
+      self._pool.reset(self, seed)
+      self._pool.prefetch(self._world_seed(self._episode + 1))
+    else:
+      self._generate(seed)
     return self._obs()
 
+  def close(self):
+    if self._pool is not None:
+      self._pool.close()
+
   def step(self, action):
     mat_map = self._world._mat_map
     self._step += 1
     self._update_time()
     self._player.action = constants.actions[action]
-    for obj in self._world.objects:
-      if self._player.distance(obj) < 2 * max(self._view):
+    # The player moves at most one cell during the sweep, so the region around
+    # its current position contains every object that is close enough.
+    radius = 2 * max(self._view)
+    creatures = self._world.creatures
+    batch = []
+    # Plants grow in the steps in which they are close enough to the player,
+    # which the world counts per cell once the step is settled.
+    self._world.reach(self._player, radius)
+    for obj in self._world.objects_near(self._player.pos, radius):
+      if creatures and creatures.holds(obj):
+        batch.append(obj)
+      elif obj.pending and self._player.distance(obj) < radius:
         obj.update()
-    if self._step % 10 == 0:
-      for chunk, objs in self._world.chunks.items():
+    if batch:
+      creatures.update(batch, self._player, radius)
+    self._world.settle()
+    if self._step % 10 == 0 and self._active_radius is not None:
+      self._balance_active()
+    elif self._step % 10 == 0:
+      for chunk in self._world.chunks:
         # xmin, xmax, ymin, ymax = chunk
         # center = (xmax - xmin) // 2, (ymax - ymin) // 2
         # if self._player.distance(center) < 4 * max(self._view):
-        self._balance_chunk(chunk, objs)
+        self._balance_chunk(chunk)
     obs = self._obs()
     reward = (self._player.health - self._last_health) / 10
     self._last_health = self._player.health
@@ -110,18 +200,56 @@ class Env(BaseClass):
     dead = self._player.health <= 0
     over = self._length and self._step >= self._length
     done = dead or over
-    info = {
-        'inventory': self._player.inventory.copy(),
-        'achievements': self._player.achievements.copy(),
-        'discount': 1 - float(dead),
-        'semantic': self._sem_view(),
-        'player_pos': self._player.pos,
-        'reward': reward,
-    }
+    info = {}
+    for key in self._info_keys:
+      if key == 'inventory':
+        info[key] = self._player.inventory.copy()
+      elif key == 'achievements':
+        info[key] = self._player.achievements.copy()
+      elif key == 'discount':
+        info[key] = 1 - float(dead)
+      elif key == 'semantic':
+        # A copy, since the map of the world changes with later steps.
+        info[key] = self._sem_view(copy=True)
+      elif key == 'player_pos':
+        info[key] = self._player.pos
+      elif key == 'reward':
+        info[key] = reward
     if not self._reward:
       reward = 0.0
     return obs, reward, done, info
 
+  def snapshot(self):
+    # Token that restore() accepts any number of times to return to the
+    # current state, including the random state of the world.
+    return dict(
+        world=self._world.snapshot(),
+        player=self._player,
+        episode=self._episode,
+        step=self._step,
+        last_health=self._last_health,
+        unlocked=set(self._unlocked),
+        balanced=dict(self._balanced),
+        text_description=self._text_description,
+        frame=self._local_view._frame)
+
+  def restore(self, token):
+    self._world.restore(token['world'])
+    self._player = token['player']
+    self._episode = token['episode']
+    self._step = token['step']
+    self._last_health = token['last_health']
+    self._unlocked = set(token['unlocked'])
+    self._balanced = dict(token['balanced'])
+    self._text_description = token['text_description']
+    self._local_view._frame = token['frame']
+
+  def save(self, path):
+    checkpoint.save(self, path)
+
+  def load(self, path):
+    return checkpoint.load(self, path)
+
   def render(self, size=None):
     size = size or self._size
     unit = size // self._view
@@ -138,8 +266,35 @@ class Env(BaseClass):
     self._text_description = text_description
     return canvas.transpose((1, 0, 2))
 
+  def _world_seed(self, episode):
+    return hash((self._seed, episode)) % (2 ** 31 - 1)
+
+  def _generate(self, seed):
+    center = (self._world.area[0] // 2, self._world.area[1] // 2)
+    self._step = 0
+    self._balanced = {}
+    self._world.reset(seed=seed)
+    self._update_time()
+    self._player = objects.Player(self._world, center)
+    self._last_health = self._player.health
+    self._world.add(self._player)
+    self._unlocked = set()
+    worldgen.generate_world(
+        self._world, self._player, self._exact_worldgen)
+
   def _obs(self):
-    return self.render()
+    obs = {}
+    if 'pixels' in self._modes:
+      obs['pixels'] = self.render()
+    else:
+      self._text_description = np.array(self._local_view.text(self._player))
+    if 'text' in self._modes:
+      obs['text'] = self.text_description()
+    if 'semantic' in self._modes:
+      obs['semantic'] = self._sem_view(copy=True)
+    if len(self._modes) == 1:
+      return obs[self._modes[0]]
+    return obs
 
   def _update_time(self):
     # https://www.desmos.com/calculator/grfbc6rs3h
@@ -147,45 +302,55 @@ class Env(BaseClass):
     daylight = 1 - np.abs(np.cos(np.pi * progress)) ** 3
     self._world.daylight = daylight
 
-  def _balance_chunk(self, chunk, objs):
+  def _balance_active(self):
+    chunks = self._world.chunks_near(self._player.pos, self._active_radius)
+    for chunk in chunks:
+      # A chunk that was dormant replays the rounds it missed, up to a limit,
+      # so that its population approaches the targets it would have had.
+      missed = (self._step - self._balanced.get(chunk, 0)) // 10
+      for _ in range(max(1, min(missed, _CATCHUP_ROUNDS))):
+        self._balance_chunk(chunk)
+      self._balanced[chunk] = self._step
+
+  def _balance_chunk(self, chunk):
     light = self._world.daylight
     self._balance_object(
-        chunk, objs, objects.Zombie, 'grass', 6, 0, 0.3, 0.4,
+        chunk, objects.Zombie, 'grass', 6, 0, 0.3, 0.4,
         lambda pos: objects.Zombie(self._world, pos, self._player),
         lambda num, space: (
             0 if space < 50 else 3.5 - 3 * light, 3.5 - 3 * light))
     self._balance_object(
-        chunk, objs, objects.Skeleton, 'path', 7, 7, 0.1, 0.1,
+        chunk, objects.Skeleton, 'path', 7, 7, 0.1, 0.1,
         lambda pos: objects.Skeleton(self._world, pos, self._player),
         lambda num, space: (0 if space < 6 else 1, 2))
     self._balance_object(
-        chunk, objs, objects.Cow, 'grass', 5, 5, 0.01, 0.1,
+        chunk, objects.Cow, 'grass', 5, 5, 0.01, 0.1,
         lambda pos: objects.Cow(self._world, pos),
         lambda num, space: (0 if space < 30 else 1, 1.5 + light))
 
   def _balance_object(
-      self, chunk, objs, cls, material, span_dist, despan_dist,
+      self, chunk, cls, material, span_dist, despan_dist,
       spawn_prob, despawn_prob, ctor, target_fn):
-    xmin, xmax, ymin, ymax = chunk
-    random = self._world.random
-    creatures = [obj for obj in objs if isinstance(obj, cls)]
-    mask = self._world.mask(*chunk, material)
-    target_min, target_max = target_fn(len(creatures), mask.sum())
-    if len(creatures) < int(target_min) and random.uniform() < spawn_prob:
-      xs = np.tile(np.arange(xmin, xmax)[:, None], [1, ymax - ymin])
-      ys = np.tile(np.arange(ymin, ymax)[None, :], [xmax - xmin, 1])
-      xs, ys = xs[mask], ys[mask]
-      i = random.randint(0, len(xs))
-      pos = np.array((xs[i], ys[i]))
-      empty = self._world[pos][1] is None
+    # The world keeps the counts per chunk up to date, so that balancing does
+    # not scan the chunk.
+    world = self._world
+    random = world.random
+    count = world.chunk_population(chunk, cls)
+    target_min, target_max = target_fn(
+        count, world.chunk_space(chunk, material))
+    if count < int(target_min) and random.uniform() < spawn_prob:
+      cells = world.chunk_cells(chunk, material)
+      pos = np.array(cells[random.randint(0, len(cells))])
+      empty = world[pos][1] is None
       away = self._player.distance(pos) >= span_dist
       if empty and away:
-        self._world.add(ctor(pos))
-    elif len(creatures) > int(target_max) and random.uniform() < despawn_prob:
+        world.add(ctor(pos))
+    elif count > int(target_max) and random.uniform() < despawn_prob:
+      creatures = world.chunk_members(chunk, cls)
       obj = creatures[random.randint(0, len(creatures))]
       away = self._player.distance(obj.pos) >= despan_dist
       if away:
-        self._world.remove(obj)
+        world.remove(obj)
 
 
   #### Helper functions  ####
@@ -322,26 +487,7 @@ class Env(BaseClass):
     
 
   def get_player_standing(self):
-    player_pos = self._player.pos
-    mat_map = self._world._mat_map
-    mat_standing = mat_map[player_pos[0]][player_pos[1]]
-    reverse_mat_id = {
-        0: None,
-        1: 'water',
-        2: 'grass',
-        3: 'stone',
-        4: 'path',
-        5: 'sand',
-        6: 'tree',
-        7: 'lava',
-        8: 'coal',
-        9: 'iron',
-        10: 'diamond',
-        11: 'table',
-        12: 'furnace'
-    }
-    return reverse_mat_id[mat_standing]
-
+    return self._world[self._player.pos][0]
 
-  
-        
\ No newline at end of file
+  def get_nearest(self, material, max_dist=None):
+    return self._world.nearest(material, self._player.pos, max_dist)
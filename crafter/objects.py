@@ -1,8 +1,64 @@
+import functools
+
 import numpy as np
 
+from . import affordances
 from . import constants
 from . import engine
 
+_DIRS = np.array(((-1, 0), (+1, 0), (0, -1), (0, +1)))
+# Smaller groups of creatures are cheaper to update one after another.
+_MIN_BATCH = 8
+_ITEMS = list(constants.items.values())
+# Material ids in the order that the environment passes materials to the
+# world, where zero stands for outside the world.
+_MATERIAL_IDS = {
+    name: index for index, name in enumerate([None] + constants.materials)}
+
+
+@functools.lru_cache()
+def _material_mask(names):
+  # Boolean table by material id of whether a material is one of the names.
+  # It covers every id of the material map, including materials that the
+  # world only learns about when they are set.
+  mask = np.zeros(256, bool)
+  mask[[_MATERIAL_IDS[name] for name in names]] = True
+  mask.flags.writeable = False
+  return mask
+
+
+_FRAGILE = _material_mask(('table', 'furnace'))
+
+
+class _Column:
+
+  # Attribute of a creature that lives in a column of the creature store while
+  # the creature is in one and on the instance otherwise.
+
+  def __set_name__(self, owner, name):
+    self._name = name
+
+  def __get__(self, obj, owner=None):
+    if obj is None:
+      return self
+    table = obj.__dict__.get('_table')
+    if table is None:
+      if self._name == 'health':
+        return obj.inventory['health']
+      return obj.__dict__[self._name]
+    return int(table.columns[self._name][obj.__dict__['_slot']])
+
+  def __set__(self, obj, value):
+    if self._name == 'health':
+      value = max(0, value)
+    table = obj.__dict__.get('_table')
+    if table is not None:
+      table.columns[self._name][obj.__dict__['_slot']] = value
+    elif self._name == 'health':
+      obj.inventory['health'] = value
+    else:
+      obj.__dict__[self._name] = value
+
 
 class Object:
 
@@ -17,9 +73,11 @@ class Object:
   def texture(self):
     raise 'unknown'
 
-  @property
-  def walkable(self):
-    return constants.walkable
+  walkable = constants.walkable
+  walkable_mask = _material_mask(tuple(walkable))
+  # Whether the object needs an update in the current step. Objects that only
+  # react to events clear it while nothing happens to them.
+  pending = True
 
   @property
   def health(self):
@@ -42,9 +100,15 @@ class Object:
     return False
 
   def is_free(self, target, materials=None):
-    materials = self.walkable if materials is None else materials
-    material, obj = self.world[target]
-    return obj is None and material in materials
+    if materials is None:
+      mask = self.walkable_mask
+    else:
+      mask = _material_mask(tuple(materials))
+    if isinstance(target, np.ndarray):
+      target = target.tolist()
+    world = self.world
+    return not world.obj_index_at(target) and mask[
+        world.material_id_at(target)]
 
   def distance(self, target):
     if hasattr(target, 'pos'):
@@ -70,9 +134,10 @@ class Player(Object):
   def __init__(self, world, pos):
     super().__init__(world, pos)
     self.facing = (0, 1)
-    self.inventory = {
-        name: info['initial'] for name, info in constants.items.items()}
-    self.achievements = {name: 0 for name in constants.achievements}
+    self.inventory = engine.Counts(
+        constants.items, [info['initial'] for info in _ITEMS],
+        [info['max'] for info in _ITEMS])
+    self.achievements = engine.Counts(constants.achievements)
     self.action = 'noop'
     self.sleeping = False
     self._last_health = self.health
@@ -92,13 +157,10 @@ class Player(Object):
         (0, +1): 'player-down',
     }[tuple(self.facing)]
 
-  @property
-  def walkable(self):
-    return constants.walkable + ['lava']
+  walkable = constants.walkable + ['lava']
+  walkable_mask = _material_mask(tuple(walkable))
 
   def update(self):
-    target = (self.pos[0] + self.facing[0], self.pos[1] + self.facing[1])
-    material, obj = self.world[target]
     action = self.action
     if self.sleeping:
       if self.inventory['energy'] < constants.items['energy']['max']:
@@ -106,130 +168,20 @@ class Player(Object):
       else:
         self.sleeping = False
         self.achievements['wake_up'] += 1
-    if action == 'noop':
-      pass
-    elif action.startswith('move_'):
-      self._move(action[len('move_'):])
-    elif action == 'do' and obj:
-      self._do_object(obj)
-    elif action == 'do':
-      self._do_material(target, material)
-    elif action == 'sleep':
-      if self.inventory['energy'] < constants.items['energy']['max']:
-        self.sleeping = True
-    elif action.startswith('place_'):
-      self._place(action[len('place_'):], target, material)
-    elif action.startswith('make_'):
-      self._make(action[len('make_'):])
+    handler, argument = _HANDLERS[action]
+    if handler:
+      handler(self, argument)
     self._update_life_stats()
     self._degen_or_regen_health()
-    for name, amount in self.inventory.items():
-      maxmium = constants.items[name]['max']
-      self.inventory[name] = max(0, min(amount, maxmium))
+    self.inventory.clamp()
     # This needs to happen after the inventory states are clamped
     # because it involves the health water inventory count.
     self._wake_up_when_hurt()
 
   def _available_action(self, state_description):
-    # Action Dynamics discovered by LLMs
-
-    available_actions = []
-    directions = {
-        'west': (-1, 0), 
-        'east': (+1, 0), 
-        'north': (0, -1), 
-        'south': (0, +1)
-    }
-    
-    # Check movements and interactions with adjacent tiles
-    for direction, diff in directions.items():
-        target = (self.pos[0] + diff[0], self.pos[1] + diff[1])
-        material, obj = self.world[target]
-        # obj_name = obj.__class__.__name__ if obj else None
-        if obj:
-            obj_texture = obj.texture
-        else:
-            obj_texture = None
-    
-        if material in ['grass', 'sand', 'path'] and obj_texture not in ['cow', 'skeleton', 'zombie', 'plant', 'plant-ripe']:
-            available_actions.append(f'move_{direction}')
-        elif diff != self.facing:
-            if obj_texture in ['cow', 'skeleton', 'zombie', 'plant', 'plant-ripe']:
-                available_actions.append(f'face_{direction}_obstructed_by_{obj_texture}')
-            if material in ['tree', 'stone', 'coal', 'iron', 'diamond', 'water']:
-                available_actions.append(f'face_{direction}_obstructed_by_{material}')
-    
-    current_facing = {v: k for k, v in directions.items()}[self.facing]
-    # Check actions based on the material in front
-    target = (self.pos[0] + self.facing[0], self.pos[1] + self.facing[1])
-    material, obj = self.world[target]
-    
-    if material == 'water' and self.inventory['wood_pickaxe'] >= 1:
-        available_actions.append(f'collect_drink_on_{current_facing}')
-    if material == 'tree':
-        available_actions.append(f'collect_wood_on_{current_facing}')
-    if material == 'stone' and self.inventory['wood_pickaxe'] >= 1:
-        available_actions.append(f'collect_stone_on_{current_facing}')
-    if material == 'coal' and self.inventory['wood_pickaxe'] >= 1:
-        available_actions.append(f'collect_coal_on_{current_facing}')
-    if material == 'iron' and self.inventory['stone_pickaxe'] >= 1:
-        available_actions.append(f'collect_iron_on_{current_facing}')
-    if material == 'diamond' and self.inventory['iron_pickaxe'] >= 1:
-        available_actions.append(f'collect_diamond_on_{current_facing}')
-    if material == 'grass' and self.inventory['wood_pickaxe'] >= 1 and self.inventory['wood_sword'] >= 1:
-        available_actions.append(f'collect_sapling_on_{current_facing}')
-    if material == 'grass' and self.inventory['sapling'] >= 1 and self.inventory['wood_pickaxe'] >= 1 and self.inventory['wood_sword'] >= 1:
-        available_actions.append(f'place_plant_on_{current_facing}')
-    
-    
-    # Check crafting actions
-    nearby, _ = self.world.nearby(self.pos, 1)
+    # Action dynamics discovered by language models, looked up from a table.
+    return affordances.available(self)
 
-    # Check actions based on the object in front
-    if obj:
-        obj_texture = obj.texture
-        if obj_texture == 'cow' and self.inventory['wood_sword'] >= 1 and self.inventory['wood_pickaxe'] >= 1:
-            available_actions.append(f'eat_cow_on_{current_facing}')
-        if obj_texture == 'skeleton' and self.inventory['wood_sword'] >= 1:
-            available_actions.append(f'defeat_skeleton_on_{current_facing}')
-        if obj_texture == 'zombie' and self.inventory['wood_sword'] >= 1:
-            available_actions.append(f'defeat_zombie_on_{current_facing}')
-        if obj_texture == 'plant-ripe' and 'stone' in nearby and self.inventory['iron_sword'] >= 1:
-            available_actions.append(f'eat_plant_on_{current_facing}')
-
-
-    if 'table' in nearby:
-        if self.inventory['wood'] >= 1:
-            available_actions.append('make_wood_pickaxe')
-            if self.inventory['wood_pickaxe'] >= 1:
-              available_actions.append('make_wood_sword')
-        if self.inventory['wood'] >= 1 and self.inventory['stone'] >= 1:
-            available_actions.append('make_stone_pickaxe')
-            if self.inventory['stone_pickaxe'] >= 1:
-              available_actions.append('make_stone_sword')
-    if 'table' in nearby and 'furnace' in nearby:
-        if self.inventory['wood'] >= 1 and self.inventory['coal'] >= 1 and self.inventory['iron'] >= 1:
-            available_actions.append('make_iron_pickaxe')
-            if self.inventory['iron_pickaxe'] >= 1:
-              available_actions.append('make_iron_sword')
-    
-    if material in ['grass', 'path'] and obj is None:
-      if self.inventory['wood'] >= 2:
-          available_actions.append(f'place_table_on_{material}_to_{current_facing}')
-      if self.inventory['stone'] >= 4 and ('table' in nearby):
-          available_actions.append(f'place_furnace_on_{material}_to_{current_facing}')
-    if material in ['grass', 'sand', 'path', 'water', 'lava'] and obj is None:
-      if self.inventory['stone'] >= 1:
-          available_actions.append(f'place_stone_on_{material}_to_{current_facing}')
-    
-        # Check energy and add sleep action if needed
-    if 'stone' in nearby and 'path' in nearby and self.inventory['stone_sword'] >= 1:
-      available_actions.append('sleep')
-    # print('available_actions: ', available_actions)
-    return available_actions
-
-    
-        
   def _update_life_stats(self):
     self._hunger += 0.5 if self.sleeping else 1
     if self._hunger > 25:
@@ -275,9 +227,21 @@ class Player(Object):
     directions = dict(left=(-1, 0), right=(+1, 0), up=(0, -1), down=(0, +1))
     self.facing = directions[direction]
     self.move(self.facing)
-    if self.world[self.pos][0] == 'lava':
+    if self.world.material_id_at(self.pos) == _MATERIAL_IDS['lava']:
       self.health = 0
 
+  def _do(self, _):
+    target = (self.pos[0] + self.facing[0], self.pos[1] + self.facing[1])
+    material, obj = self.world[target]
+    if obj:
+      self._do_object(obj)
+    else:
+      self._do_material(target, material)
+
+  def _sleep(self, _):
+    if self.inventory['energy'] < constants.items['energy']['max']:
+      self.sleeping = True
+
   def _do_object(self, obj):
     damage = max([
         1,
@@ -328,8 +292,10 @@ class Player(Object):
         self.inventory[name] += amount
         self.achievements[f'collect_{name}'] += 1
 
-  def _place(self, name, target, material):
-    if self.world[target][1]:
+  def _place(self, name):
+    target = (self.pos[0] + self.facing[0], self.pos[1] + self.facing[1])
+    material, obj = self.world[target]
+    if obj:
       return
     info = constants.place[name]
     if material not in info['where']:
@@ -361,8 +327,27 @@ class Player(Object):
     self.achievements[f'make_{name}'] += 1
 
 
+def _handlers():
+  # Handler and its argument for each action name, so that the player does
+  # not parse the name of its action in every step.
+  handlers = {'noop': (None, None)}
+  prefixes = {
+      'move_': Player._move, 'place_': Player._place, 'make_': Player._make}
+  for name in constants.actions:
+    for prefix, handler in prefixes.items():
+      if name.startswith(prefix):
+        handlers[name] = (handler, name[len(prefix):])
+  handlers.update(do=(Player._do, None), sleep=(Player._sleep, None))
+  return handlers
+
+
+_HANDLERS = _handlers()
+
+
 class Cow(Object):
 
+  health = _Column()
+
   def __init__(self, world, pos):
     super().__init__(world, pos)
     self.health = 3
@@ -381,6 +366,9 @@ class Cow(Object):
 
 class Zombie(Object):
 
+  health = _Column()
+  cooldown = _Column()
+
   def __init__(self, world, pos, player):
     super().__init__(world, pos)
     self.player = player
@@ -414,6 +402,9 @@ class Zombie(Object):
 
 class Skeleton(Object):
 
+  health = _Column()
+  reload = _Column()
+
   def __init__(self, world, pos, player):
     super().__init__(world, pos)
     self.player = player
@@ -453,6 +444,8 @@ class Skeleton(Object):
 
 class Arrow(Object):
 
+  health = _Column()
+
   def __init__(self, world, pos, facing):
     super().__init__(world, pos)
     self.facing = facing
@@ -466,19 +459,19 @@ class Arrow(Object):
         (0, +1): 'arrow-down',
     }[tuple(self.facing)]
 
-  @engine.staticproperty
-  def walkable():
-    return constants.walkable + ['water', 'lava']
+  walkable = constants.walkable + ['water', 'lava']
+  walkable_mask = _material_mask(tuple(walkable))
 
   def update(self):
-    target = self.pos + self.facing
-    material, obj = self.world[target]
-    if obj:
-      obj.health -= 2
+    target = (self.pos + self.facing).tolist()
+    if self.world.obj_index_at(target):
+      self.world[target][1].health -= 2
       self.world.remove(self)
-    elif material not in self.walkable:
+      return
+    material = self.world.material_id_at(target)
+    if not self.walkable_mask[material]:
       self.world.remove(self)
-      if material in ['table', 'furnace']:
+      if _FRAGILE[material]:
         self.world[target] = 'path'
     else:
       self.move(self.facing)
@@ -489,7 +482,8 @@ class Plant(Object):
   def __init__(self, world, pos):
     super().__init__(world, pos)
     self.health = 1
-    self.grown = 0
+    # New plants start growing in the step after they were placed.
+    self._grown = -world.reached(self.pos, current=True)
 
   @property
   def texture(self):
@@ -502,13 +496,39 @@ class Plant(Object):
   def ripe(self):
     return self.grown > 300
 
+  @property
+  def grown(self):
+    # Plants grow in every step in which the player is close enough to update
+    # them, which the world counts per cell.
+    return self._grown + self.world.reached(self.pos)
+
+  @grown.setter
+  def grown(self, value):
+    self._grown = value - self.world.reached(self.pos)
+
+  @property
+  def health(self):
+    return self.inventory['health']
+
+  @health.setter
+  def health(self, value):
+    self.inventory['health'] = max(0, value)
+    self.pending = True
+
+  def notice(self, obj):
+    # Only plants that were damaged or had a creature arrive next to them
+    # need an update.
+    if isinstance(obj, (Zombie, Skeleton, Cow)):
+      self.pending = True
+
   def update(self):
-    self.grown += 1
     objs = [self.world[self.pos + dir_][1] for dir_ in self.all_dirs]
-    if any(isinstance(obj, (Zombie, Skeleton, Cow)) for obj in objs):
+    threatened = any(isinstance(obj, (Zombie, Skeleton, Cow)) for obj in objs)
+    if threatened:
       self.health -= 1
     if self.health <= 0:
       self.world.remove(self)
+    self.pending = threatened
 
 
 class Fence(Object):
@@ -521,4 +541,257 @@ class Fence(Object):
     return 'fence'
 
   def update(self):
-    pass
\ No newline at end of file
+    pass
+
+
+class CreatureStore:
+
+  # Health, cooldown and reload of zombies, skeletons, cows and arrows in
+  # typed columns per type, with a batched update for each type. Objects of
+  # the given types join the store when they are added to the world and
+  # leave it with their values when they are removed.
+
+  def __init__(self, types=(Zombie, Skeleton, Cow)):
+    fields = {Zombie: ('cooldown',), Skeleton: ('reload',)}
+    self._tables = {cls: _Table(fields.get(cls, ())) for cls in types}
+
+  def holds(self, obj):
+    return type(obj) in self._tables
+
+  def add(self, obj):
+    if type(obj) in self._tables:
+      self._tables[type(obj)].add(obj)
+
+  def remove(self, obj):
+    if obj.__dict__.get('_table') is not None:
+      obj._table.remove(obj)
+
+  def snapshot(self):
+    return {cls: table.snapshot() for cls, table in self._tables.items()}
+
+  def restore(self, state):
+    for cls, table in self._tables.items():
+      table.restore(state[cls])
+
+  def update(self, objs, player, radius):
+    # Zombies, skeletons, cows and arrows closer to the player than the
+    # radius are updated in turn. Within a type, random numbers are drawn for
+    # all of them at once and conflicts are resolved in update order.
+    kernels = (
+        (Zombie, _update_zombies), (Skeleton, _update_skeletons),
+        (Cow, _update_cows), (Arrow, _update_arrows))
+    for cls, kernel in kernels:
+      if cls not in self._tables:
+        continue
+      group = [obj for obj in objs if type(obj) is cls and not obj.removed]
+      if not group:
+        continue
+      positions = _positions(group)
+      near = np.abs(positions - player.pos).sum(1) < radius
+      group = [obj for obj, keep in zip(group, near.tolist()) if keep]
+      if len(group) < _MIN_BATCH:
+        for obj in group:
+          obj.update()
+      else:
+        kernel(player.world, self._tables[cls], group, positions[near], player)
+
+
+class _Table:
+
+  def __init__(self, fields):
+    self.fields = fields
+    self.columns = {'health': np.zeros(0, np.int64)}
+    for name in fields:
+      self.columns[name] = np.zeros(0, np.int64)
+    self.objs = []
+    self.free = []
+
+  def add(self, obj):
+    if not self.free:
+      self._grow()
+    slot = self.free.pop()
+    attrs = obj.__dict__
+    self.columns['health'][slot] = obj.inventory['health']
+    for name in self.fields:
+      self.columns[name][slot] = attrs.pop(name)
+    self.objs[slot] = obj
+    attrs['_table'], attrs['_slot'] = self, slot
+
+  def remove(self, obj):
+    attrs = obj.__dict__
+    slot = attrs.pop('_slot')
+    del attrs['_table']
+    obj.inventory['health'] = int(self.columns['health'][slot])
+    for name in self.fields:
+      attrs[name] = int(self.columns[name][slot])
+    self.objs[slot] = None
+    self.free.append(slot)
+
+  def snapshot(self):
+    columns = {name: column.copy() for name, column in self.columns.items()}
+    return columns, list(self.objs), list(self.free)
+
+  def restore(self, state):
+    columns, objs, free = state
+    self.columns = {name: column.copy() for name, column in columns.items()}
+    self.objs = list(objs)
+    self.free = list(free)
+
+  def _grow(self):
+    size = len(self.objs)
+    capacity = max(16, 2 * size)
+    for name, column in self.columns.items():
+      grown = np.zeros((capacity,) + column.shape[1:], column.dtype)
+      grown[:size] = column
+      self.columns[name] = grown
+    self.objs += [None] * (capacity - size)
+    self.free = list(range(capacity - 1, size - 1, -1))
+
+
+def _update_cows(world, table, group, positions, player):
+  slots, alive = _remove_dead(world, table, group)
+  wander, direction = world.random.uniform(size=(2, len(group)))
+  _move(world, group, positions, _DIRS[(4 * direction).astype(int)],
+        alive & (wander < 0.5))
+
+
+def _update_zombies(world, table, group, positions, player):
+  slots, alive = _remove_dead(world, table, group)
+  chase, long_axis, direction = world.random.uniform(size=(3, len(group)))
+  directions = _DIRS[(4 * direction).astype(int)]
+  offset = player.pos - positions
+  chase = (np.abs(offset).sum(1) <= 8) & (chase < 0.9)
+  directions[chase] = _toward(offset, long_axis < 0.8)[chase]
+  _move(world, group, positions, directions, alive)
+  near = np.abs(player.pos - positions).sum(1) <= 1
+  cooldown = table.columns['cooldown']
+  cooling = near & (cooldown[slots] > 0)
+  attack = near & ~cooling
+  cooldown[slots[cooling]] -= 1
+  cooldown[slots[attack]] = 5
+  _store_dead(table, group, slots, alive, 'cooldown')
+  damage = 7 if player.sleeping else 2
+  for _ in range(int(attack.sum())):
+    player.health -= damage
+
+
+def _update_skeletons(world, table, group, positions, player):
+  slots, alive = _remove_dead(world, table, group)
+  reload = table.columns['reload']
+  reload[slots] = np.maximum(0, reload[slots] - 1)
+  _store_dead(table, group, slots, alive, 'reload')
+  retreat, shoot, approach, approach_axis, wander, direction = (
+      world.random.uniform(size=(6, len(group))))
+  directions = _DIRS[(4 * direction).astype(int)]
+  offset = player.pos - positions
+  dist = np.abs(offset).sum(1)
+  moved = _move(
+      world, group, positions, -_toward(offset, retreat < 0.6),
+      alive & (dist <= 3))
+  shoot = ~moved & (dist <= 5) & (shoot < 0.5)
+  approach = ~moved & ~shoot & (dist <= 8) & (approach < 0.3)
+  wander = ~moved & ~shoot & ~approach & (wander < 0.2)
+  for index in np.flatnonzero(shoot).tolist():
+    group[index]._shoot(_toward(offset[index: index + 1], [True])[0])
+  directions[approach] = _toward(offset, approach_axis < 0.6)[approach]
+  _move(world, group, positions, directions, alive & (approach | wander))
+
+
+def _update_arrows(world, table, group, positions, player):
+  # Arrows fly in update order. An arrow that hits an object damages it and
+  # one that hits an obstacle breaks, destroying tables and furnaces. The
+  # cells that earlier arrows left, entered or destroyed are tracked on top
+  # of the maps, which are updated once at the end.
+  facings = np.array([obj.facing for obj in group]).reshape(-1, 2)
+  targets = positions + facings
+  walkable = world.cells_of(targets, Arrow.walkable_mask)
+  fragile = world.cells_of(targets, _FRAGILE)
+  occupants = {}
+  destroyed = set()
+  broken = []
+  moving = []
+  cells = zip(
+      group, map(tuple, positions.tolist()), map(tuple, targets.tolist()),
+      world.occupants(targets), walkable.tolist(), fragile.tolist())
+  for index, (arrow, source, target, obj, free, fragile) in enumerate(cells):
+    obj = occupants.get(target, obj)
+    occupants[source] = None
+    if obj:
+      obj.health -= 2
+      broken.append(arrow)
+    elif free or target in destroyed:
+      occupants[target] = arrow
+      moving.append(index)
+    else:
+      broken.append(arrow)
+      if fragile:
+        world[target] = 'path'
+        destroyed.add(target)
+  world.remove_many(broken)
+  if moving:
+    world.move_many([group[index] for index in moving], targets[moving])
+
+
+def _remove_dead(world, table, group):
+  # Removes the creatures without health and returns the slots of all of them
+  # with a mask of the living ones. Like Object.update(), removed creatures
+  # finish their update where they are, so zombies can still attack and
+  # skeletons still shoot, but they no longer move. Their slots keep their
+  # values until the end of the update, since nothing joins the table.
+  slots = np.array([obj._slot for obj in group])
+  alive = table.columns['health'][slots] > 0
+  for index in np.flatnonzero(~alive).tolist():
+    world.remove(group[index])
+  return slots, alive
+
+
+def _store_dead(table, group, slots, alive, name):
+  # Removed creatures keep their values on the instance.
+  for index in np.flatnonzero(~alive).tolist():
+    setattr(group[index], name, int(table.columns[name][slots[index]]))
+
+
+def _positions(group):
+  return np.array([obj.pos for obj in group]).reshape(-1, 2)
+
+
+def _toward(offset, long_axis):
+  # Vectorized version of Object.toward() for rows of offsets.
+  dists = np.abs(offset)
+  horizontal = np.where(
+      long_axis, dists[:, 0] > dists[:, 1], dists[:, 0] <= dists[:, 1])
+  result = np.zeros_like(offset)
+  result[:, 0] = np.where(horizontal, np.sign(offset[:, 0]), 0)
+  result[:, 1] = np.where(horizontal, 0, np.sign(offset[:, 1]))
+  return result
+
+
+def _move(world, group, positions, directions, mask):
+  # Moves the masked creatures in update order and updates their positions.
+  # A move succeeds when the target is walkable and free after the moves
+  # before it, which only needs the cells that earlier moves changed on top
+  # of the maps.
+  moved = np.zeros(len(group), bool)
+  indices = np.flatnonzero(mask)
+  if not len(indices):
+    return moved
+  sources = positions[indices]
+  targets = sources + directions[indices]
+  walkable = world.cells_of(targets, Object.walkable_mask)
+  occupied = world.occupied(targets)
+  changed = {}
+  success = []
+  cells = zip(
+      indices.tolist(), map(tuple, sources.tolist()),
+      map(tuple, targets.tolist()), walkable.tolist(), occupied.tolist())
+  for index, source, target, allowed, taken in cells:
+    if allowed and not changed.get(target, taken):
+      changed[target] = True
+      changed[source] = False
+      success.append(index)
+  if success:
+    moved[success] = True
+    positions[success] = targets[moved[indices]]
+    world.move_many(
+        [group[index] for index in success], positions[success])
+  return moved
@@ -0,0 +1,107 @@
+import concurrent.futures
+import multiprocessing
+import os
+import pathlib
+import shutil
+import tempfile
+import weakref
+
+from . import checkpoint
+
+
+class WorldPool:
+
+  def __init__(self, env_cls, kwargs, directory=None, capacity=256,
+               prefetch=True):
+    # Generated worlds are stored as checkpoints keyed by the world seed and
+    # the arguments that affect generation. A directory that outlives the
+    # process lets later runs over the same seeds skip generation entirely.
+    self._env_cls = env_cls
+    self._kwargs = kwargs
+    if directory is None:
+      directory = tempfile.mkdtemp(prefix='crafter-worlds-')
+      weakref.finalize(self, shutil.rmtree, directory, True)
+    self._directory = pathlib.Path(directory)
+    self._directory.mkdir(parents=True, exist_ok=True)
+    self._capacity = capacity
+    self._pending = {}
+    self._executor = None
+    if prefetch:
+      # Daemonic processes, such as the workers of a vector environment,
+      # cannot start processes of their own and generate in a thread instead.
+      if multiprocessing.current_process().daemon:
+        self._executor = concurrent.futures.ThreadPoolExecutor(1)
+      else:
+        self._executor = concurrent.futures.ProcessPoolExecutor(1)
+      weakref.finalize(self, self._executor.shutdown, False)
+
+  def reset(self, env, seed):
+    # Swaps the world for the seed into the environment, from the pool when
+    # it is there and otherwise by generating and storing it.
+    path = self._path(seed)
+    future = self._pending.pop(seed, None)
+    if future is not None:
+      future.result()
+    if path.exists():
+      try:
+        checkpoint.load_world(env, path)
+        os.utime(path)
+        return
+      except (OSError, ValueError):
+        # Removed by another process or written by an incompatible version.
+        pass
+    env._generate(seed)
+    checkpoint.save(env, path)
+    self._evict()
+
+  def prefetch(self, seed):
+    if self._executor is None or seed in self._pending:
+      return
+    path = self._path(seed)
+    if path.exists():
+      return
+    self._pending[seed] = self._executor.submit(
+        _generate, self._env_cls, self._kwargs, seed, str(path))
+
+  def close(self):
+    if self._executor is not None:
+      self._executor.shutdown(wait=True, cancel_futures=True)
+      self._executor = None
+    self._pending.clear()
+
+  def _path(self, seed):
+    area = 'x'.join(str(int(x)) for x in self._kwargs['area'])
+    mode = 'exact' if self._kwargs['exact_worldgen'] else 'fast'
+    if not self._kwargs['exact_random']:
+      mode += '-fastrandom'
+    return self._directory / f'{area}-{mode}-{seed}.crafter'
+
+  def _evict(self):
+    # Keeps the most recently used worlds. Checkpoints are replaced by atomic
+    # renames, so removing one never affects a reader that opened it already.
+    entries = []
+    for path in self._directory.glob('*.crafter'):
+      try:
+        entries.append((path.stat().st_mtime, path))
+      except FileNotFoundError:
+        pass
+    entries.sort()
+    for _, path in entries[:max(0, len(entries) - self._capacity)]:
+      try:
+        path.unlink()
+      except FileNotFoundError:
+        pass
+
+
+_envs = {}
+
+
+def _generate(env_cls, kwargs, seed, path):
+  # Runs in the background worker, which keeps one environment per set of
+  # arguments around to avoid loading textures for every world.
+  key = (env_cls, tuple(sorted(kwargs.items())))
+  if key not in _envs:
+    _envs[key] = env_cls(**kwargs)
+  env = _envs[key]
+  env._generate(seed)
+  checkpoint.save(env, path)
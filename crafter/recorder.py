@@ -2,7 +2,6 @@ import datetime
 import json
 import pathlib
 
-import imageio
 import numpy as np
 
 
@@ -28,6 +27,7 @@ class Recorder:
 class StatsRecorder:
 
   def __init__(self, env, directory):
+    _require_info(env, ('reward', 'achievements'))
     self._env = env
     self._directory = pathlib.Path(directory).expanduser()
     self._directory.mkdir(exist_ok=True, parents=True)
@@ -96,12 +96,14 @@ class VideoRecorder:
 
   def _save(self):
     filename = str(self._directory / (self._env.episode_name + '.mp4'))
+    import imageio
     imageio.mimsave(filename, self._frames, codec='libx264', fps=10)
 
 
 class EpisodeRecorder:
 
   def __init__(self, env, directory):
+    _require_info(env, ('inventory', 'achievements'))
     if not hasattr(env, 'episode_name'):
       env = EpisodeName(env)
     self._env = env
@@ -167,6 +169,7 @@ class EpisodeRecorder:
 class EpisodeName:
 
   def __init__(self, env):
+    _require_info(env, ('achievements',))
     self._env = env
     self._timestamp = None
     self._unlocked = None
@@ -195,3 +198,11 @@ class EpisodeName:
   @property
   def episode_name(self):
     return f'{self._timestamp}-ach{self._unlocked}-len{self._length}'
+
+
+def _require_info(env, keys):
+  # Recorders read these keys from the info dict of every step, which
+  # environments leave out when they are not among their info keys.
+  missing = [key for key in keys if key not in getattr(env, '_info_keys', keys)]
+  if missing:
+    raise ValueError(f'Recording needs the info keys {missing}.')
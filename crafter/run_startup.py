@@ -0,0 +1,62 @@
+import argparse
+import importlib.util
+import json
+import pathlib
+import subprocess
+import sys
+
+import numpy as np
+
+# Runs in a fresh interpreter for every measurement, so that imports, caches
+# and textures all start cold.
+PROGRAM = '''
+import json, sys, time
+start = time.perf_counter()
+import crafter
+imported = time.perf_counter()
+env = crafter.Env(**json.loads(sys.argv[1]))
+created = time.perf_counter()
+env.reset()
+reset = time.perf_counter()
+env.step(0)
+stepped = time.perf_counter()
+print(json.dumps({
+    'import': imported - start, 'init': created - imported,
+    'reset': reset - created, 'step': stepped - reset,
+    'total': stepped - start}))
+'''
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--runs', type=int, default=5)
+  parser.add_argument('--area', nargs=2, type=int, default=(64, 64))
+  parser.add_argument('--observation', type=str, default='pixels')
+  parser.add_argument('--fast-worldgen', action='store_true')
+  parser.add_argument('--clear-cache', action='store_true')
+  args = parser.parse_args()
+
+  kwargs = dict(
+      area=args.area, observation=args.observation,
+      exact_worldgen=not args.fast_worldgen)
+  # Parsed constants that are cached next to the package.
+  cache = pathlib.Path(importlib.util.find_spec('crafter').origin).parent
+  cache = cache / '__pycache__' / 'data.json'
+  results = []
+  for _ in range(args.runs):
+    if args.clear_cache:
+      cache.unlink(missing_ok=True)
+    output = subprocess.run(
+        [sys.executable, '-c', PROGRAM, json.dumps(kwargs)],
+        check=True, capture_output=True, text=True).stdout
+    results.append(json.loads(output.strip().splitlines()[-1]))
+  print(f'Cold start over {args.runs} runs (median, min, max):')
+  for name in results[0]:
+    times = 1000 * np.array([result[name] for result in results])
+    print(
+        f'{name:>6}: {np.median(times):7.1f}ms '
+        f'{times.min():7.1f}ms {times.max():7.1f}ms')
+
+
+if __name__ == '__main__':
+  main()
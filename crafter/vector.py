@@ -0,0 +1,139 @@
+import multiprocessing
+
+import numpy as np
+
+from . import constants
+from . import engine
+from . import env as envlib
+
+
+class VecEnv:
+
+  def __init__(self, num_envs, seed=0, autoreset=True, context=None, **kwargs):
+    # Each worker gets its own seed derived from the given one, so a vector
+    # environment is reproducible as a whole and its members differ.
+    seeds = np.random.SeedSequence(seed).spawn(num_envs)
+    seeds = [int(child.generate_state(1)[0]) for child in seeds]
+    # Observations are written to a shared pixel buffer.
+    observation = kwargs.pop('observation', 'pixels')
+    assert observation == 'pixels', (
+        f'Vector environments only support pixel observations: {observation}')
+    # The probe only reads the spaces and shapes, so it gets no world pool.
+    probe = envlib.Env(**{
+        key: value for key, value in kwargs.items()
+        if key not in ('prefetch', 'world_pool')})
+    try:
+      self.num_envs = num_envs
+      self.observation_space = probe.observation_space
+      self.action_space = probe.action_space
+      # Textures that are loaded before the workers are forked are shared
+      # with them instead of being decoded again in every process.
+      engine.Textures.shared(
+          constants.root / 'assets', [probe._size // probe._view])
+      obs_shape = (num_envs,) + tuple(probe.observation_space.shape)
+      sem_shape = (num_envs,) + tuple(probe._area)
+    finally:
+      probe.close()
+    ctx = multiprocessing.get_context(context)
+    buffers = (
+        ctx.RawArray('B', int(np.prod(obs_shape))),
+        ctx.RawArray('B', int(np.prod(sem_shape))))
+    self._obs = np.frombuffer(buffers[0], np.uint8).reshape(obs_shape)
+    self._semantic = np.frombuffer(buffers[1], np.uint8).reshape(sem_shape)
+    self._conns = []
+    self._procs = []
+    for index, worker_seed in enumerate(seeds):
+      parent, child = ctx.Pipe()
+      proc = ctx.Process(
+          target=_worker, daemon=True,
+          args=(index, child, worker_seed, kwargs, autoreset, buffers))
+      proc.start()
+      child.close()
+      self._conns.append(parent)
+      self._procs.append(proc)
+    self._waiting = False
+
+  @property
+  def observations(self):
+    return self._obs
+
+  @property
+  def semantic(self):
+    return self._semantic
+
+  def reset(self):
+    # The returned arrays are views of the shared buffers and are overwritten
+    # by the next call to reset or step.
+    for conn in self._conns:
+      conn.send(('reset', None))
+    for conn in self._conns:
+      conn.recv()
+    return self._obs
+
+  def step_async(self, actions):
+    assert not self._waiting, 'Call step_wait() before stepping again.'
+    assert len(actions) == self.num_envs, (len(actions), self.num_envs)
+    for conn, action in zip(self._conns, actions):
+      conn.send(('step', int(action)))
+    self._waiting = True
+
+  def step_wait(self):
+    assert self._waiting, 'Call step_async() first.'
+    results = [conn.recv() for conn in self._conns]
+    self._waiting = False
+    rewards, dones, infos = zip(*results)
+    rewards = np.array(rewards, np.float32)
+    dones = np.array(dones, bool)
+    return self._obs, rewards, dones, list(infos)
+
+  def step(self, actions):
+    self.step_async(actions)
+    return self.step_wait()
+
+  def close(self):
+    if self._waiting:
+      self.step_wait()
+    for conn in self._conns:
+      try:
+        conn.send(('close', None))
+      except (BrokenPipeError, EOFError):
+        pass
+    for proc in self._procs:
+      proc.join()
+    self._conns = []
+    self._procs = []
+
+
+def _worker(index, conn, seed, kwargs, autoreset, buffers):
+  # The semantic map travels through the shared buffer, where it is copied
+  # from a view of the world, so it is left out of the info dict.
+  kwargs = dict(kwargs)
+  info_keys = kwargs.pop('info_keys', None)
+  info_keys = envlib._INFO_KEYS if info_keys is None else info_keys
+  info_keys = [key for key in info_keys if key != 'semantic']
+  env = envlib.Env(seed=seed, info_keys=info_keys, **kwargs)
+  obs_buffer = np.frombuffer(buffers[0], np.uint8).reshape(
+      (-1,) + tuple(env.observation_space.shape))[index]
+  sem_buffer = np.frombuffer(buffers[1], np.uint8).reshape(
+      (-1,) + tuple(env._area))[index]
+  try:
+    while True:
+      command, data = conn.recv()
+      if command == 'reset':
+        obs_buffer[:] = env.reset()
+        sem_buffer[:] = env._sem_view()
+        conn.send(None)
+      elif command == 'step':
+        obs, reward, done, info = env.step(data)
+        if done and autoreset:
+          obs = env.reset()
+        obs_buffer[:] = obs
+        sem_buffer[:] = env._sem_view()
+        conn.send((reward, done, info))
+      elif command == 'close':
+        break
+  except KeyboardInterrupt:
+    pass
+  finally:
+    env.close()
+    conn.close()
@@ -1,90 +1,376 @@
-import functools
-
 import numpy as np
-import opensimplex
 
 from . import constants
 from . import objects
 
-def generate_world(world, player):
-  simplex = opensimplex.OpenSimplex(seed=world.random.randint(0, 2 ** 31 - 1))
-  tunnels = np.zeros(world.area, bool)
-  for x in range(world.area[0]):
-    for y in range(world.area[1]):
-      _set_material(world, (x, y), player, tunnels, simplex)
-  for x in range(world.area[0]):
-    for y in range(world.area[1]):
-      _set_object(world, (x, y), player, tunnels)
-
-
-def _set_material(world, pos, player, tunnels, simplex):
-  x, y = pos
-  simplex = functools.partial(_simplex, simplex)
-  uniform = world.random.uniform
-  start = 4 - np.sqrt((x - player.pos[0]) ** 2 + (y - player.pos[1]) ** 2)
-  start += 2 * simplex(x, y, 8, 3)
+# Gradients and constants of the 3D OpenSimplex noise of the opensimplex
+# package, which the vectorized port below reproduces exactly.
+_GRADIENTS3 = np.array([
+    -11, 4, 4, -4, 11, 4, -4, 4, 11, 11, 4, 4, 4, 11, 4, 4, 4, 11,
+    -11, -4, 4, -4, -11, 4, -4, -4, 11, 11, -4, 4, 4, -11, 4, 4, -4, 11,
+    -11, 4, -4, -4, 11, -4, -4, 4, -11, 11, 4, -4, 4, 11, -4, 4, 4, -11,
+    -11, -4, -4, -4, -11, -4, -4, -4, -11, 11, -4, -4, 4, -11, -4, 4, -4, -11,
+], np.int64).reshape(-1, 3)
+_STRETCH3 = -1.0 / 6
+_SQUISH3 = 1.0 / 3
+_NORM3 = 103
+# Lattice points of the super-cell that contribute in each of its three
+# regions, in the order in which their contributions are summed.
+_REGIONS = (
+    ((0, 0, 0), (1, 0, 0), (0, 1, 0), (0, 0, 1)),
+    ((1, 1, 0), (1, 0, 1), (0, 1, 1), (1, 1, 1)),
+    ((1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 0), (1, 0, 1), (0, 1, 1)),
+)
+
+
+def generate_world(world, player, exact=True):
+  # Every noise layer is computed for the cells that need it at once and
+  # materials are assigned with masks. Both modes evaluate the same noise as
+  # opensimplex. The exact mode resolves the random draws in the same cell
+  # order as a per-cell generator, so that each seed produces the same world
+  # as before. The fast mode draws all random numbers in one batch, which
+  # yields different worlds from the same distribution.
+  seed = world.random.randint(0, 2 ** 31 - 1)
+  noise = _Noise(seed)
+  area = world.area
+  xs, ys = np.arange(area[0]), np.arange(area[1])
+  dist = np.sqrt(
+      (xs[:, None] - player.pos[0]) ** 2 + (ys[None, :] - player.pos[1]) ** 2)
+  start = 4 - dist + 2 * noise(xs, ys, 8, 3)
   start = 1 / (1 + np.exp(-start))
-  water = simplex(x, y, 3, {15: 1, 5: 0.15}, False) + 0.1
+  water = noise(xs, ys, 3, {15: 1, 5: 0.15}, False) + 0.1
   water -= 2 * start
-  mountain = simplex(x, y, 0, {15: 1, 5: 0.3})
+  mountain = noise(xs, ys, 0, {15: 1, 5: 0.3})
   mountain -= 4 * start + 0.3 * water
-  if start > 0.5:
-    world[x, y] = 'grass'
-  elif mountain > 0.15:
-    if (simplex(x, y, 6, 7) > 0.15 and mountain > 0.3):  # cave
-      world[x, y] = 'path'
-    elif simplex(2 * x, y / 5, 7, 3) > 0.4:  # horizonal tunnle
-      world[x, y] = 'path'
-      tunnels[x, y] = True
-    elif simplex(x / 5, 2 * y, 7, 3) > 0.4:  # vertical tunnle
-      world[x, y] = 'path'
-      tunnels[x, y] = True
-    elif simplex(x, y, 1, 8) > 0 and uniform() > 0.85:
-      world[x, y] = 'coal'
-    elif simplex(x, y, 2, 6) > 0.4 and uniform() > 0.75:
-      world[x, y] = 'iron'
-    elif mountain > 0.18 and uniform() > 0.994:
-      world[x, y] = 'diamond'
-    elif mountain > 0.3 and simplex(x, y, 6, 5) > 0.35:
-      world[x, y] = 'lava'
-    else:
-      world[x, y] = 'stone'
-  elif 0.25 < water <= 0.35 and simplex(x, y, 4, 9) > -0.2:
-    world[x, y] = 'sand'
-  elif 0.3 < water:
-    world[x, y] = 'water'
-  else:  # grassland
-    if simplex(x, y, 5, 7) > 0 and uniform() > 0.8:
-      world[x, y] = 'tree'
-    else:
-      world[x, y] = 'grass'
-
-
-def _set_object(world, pos, player, tunnels):
-  x, y = pos
-  uniform = world.random.uniform
-  dist = np.sqrt((x - player.pos[0]) ** 2 + (y - player.pos[1]) ** 2)
-  material, _ = world[x, y]
-  if material not in constants.walkable:
-    pass
-  elif dist > 3 and material == 'grass' and uniform() > 0.985:
-    world.add(objects.Cow(world, (x, y)))
-  elif dist > 10 and uniform() > 0.993:
-    world.add(objects.Zombie(world, (x, y), player))
-  elif material == 'path' and tunnels[x, y] and uniform() > 0.95:
-    world.add(objects.Skeleton(world, (x, y), player))
-
-
-def _simplex(simplex, x, y, z, sizes, normalize=True):
-  if not isinstance(sizes, dict):
-    sizes = {sizes: 1}
-  value = 0
-  for size, weight in sizes.items():
-    if hasattr(simplex, 'noise3d'):
-      noise = simplex.noise3d(x / size, y / size, z)
+
+  lowland = (start <= 0.5) & ~(mountain > 0.15)
+  rest = (start <= 0.5) & (mountain > 0.15)
+  cave = rest & (mountain > 0.3)
+  cave &= noise(xs, ys, 6, 7, mask=cave) > 0.15
+  rest &= ~cave
+  tunnels = rest & (noise(2 * xs, ys / 5, 7, 3, mask=rest) > 0.4)
+  rest &= ~tunnels
+  tunnels |= rest & (noise(xs / 5, 2 * ys, 7, 3, mask=rest) > 0.4)
+  rest &= ~tunnels
+  coal = rest & (noise(xs, ys, 1, 8, mask=rest) > 0)
+  iron = rest & (noise(xs, ys, 2, 6, mask=rest) > 0.4)
+  diamond = rest & (mountain > 0.18)
+  lava = rest & (mountain > 0.3)
+  lava &= noise(xs, ys, 6, 5, mask=lava) > 0.35
+  sand = lowland & (0.25 < water) & (water <= 0.35)
+  sand &= noise(xs, ys, 4, 9, mask=sand) > -0.2
+  lake = lowland & ~sand & (0.3 < water)
+  grassland = lowland & ~sand & ~lake
+  tree = grassland & (noise(xs, ys, 5, 7, mask=grassland) > 0)
+
+  draw = _draw_exact if exact else _draw_batch
+  hits = draw(
+      world.random, [coal, iron, diamond, tree], [0.85, 0.75, 0.994, 0.8])
+  ids = world._mat_ids
+  mat_map = np.full(area, ids['grass'], np.uint8)
+  mat_map[rest] = ids['stone']
+  mat_map[lava & (hits < 0)] = ids['lava']
+  mat_map[cave | tunnels] = ids['path']
+  mat_map[sand] = ids['sand']
+  mat_map[lake] = ids['water']
+  for index, name in enumerate(['coal', 'iron', 'diamond', 'tree']):
+    mat_map[hits == index] = ids[name]
+  world.set_materials(mat_map)
+
+  walkable = np.isin(mat_map, [ids[name] for name in constants.walkable])
+  hits = draw(world.random, [
+      walkable & (dist > 3) & (mat_map == ids['grass']),
+      walkable & (dist > 10),
+      walkable & (mat_map == ids['path']) & tunnels,
+  ], [0.985, 0.993, 0.95])
+  for x, y in zip(*[axis.tolist() for axis in np.nonzero(hits >= 0)]):
+    kind = hits[x, y]
+    if kind == 0:
+      world.add(objects.Cow(world, (x, y)))
+    elif kind == 1:
+      world.add(objects.Zombie(world, (x, y), player))
     else:
-      noise = simplex.noise3(x / size, y / size, z)
-    value += weight * noise
-  if normalize:
-    value /= sum(sizes.values())
-  return value
+      world.add(objects.Skeleton(world, (x, y), player))
+
+
+def _draw_exact(random, masks, thresholds):
+  # Each cell draws for its candidates in order until one succeeds, and the
+  # cells are visited in row-major order. A block of numbers large enough for
+  # every candidate is drawn ahead, and afterwards the generator is advanced
+  # by the count that was actually used.
+  masks = np.stack(masks, -1)
+  hits = np.full(masks.shape[:-1], -1, np.int64)
+  cells = np.nonzero(masks.any(-1))
+  state = random.get_state()
+  values = random.uniform(size=int(masks.sum())).tolist()
+  random.set_state(state)
+  used = 0
+  found = []
+  for row in masks[cells].tolist():
+    hit = -1
+    for index, candidate in enumerate(row):
+      if candidate:
+        used += 1
+        if values[used - 1] > thresholds[index]:
+          hit = index
+          break
+    found.append(hit)
+  random.uniform(size=used)
+  hits[cells] = found
+  return hits
+
+
+def _draw_batch(random, masks, thresholds):
+  masks = np.stack(masks, -1)
+  success = masks & (random.uniform(size=masks.shape) > thresholds)
+  return np.where(success.any(-1), success.argmax(-1), -1)
+
+
+class _Noise:
+
+  def __init__(self, seed):
+    self._perm, self._grad = _permutation(seed)
+
+  def __call__(self, xs, ys, z, sizes, normalize=True, mask=None):
+    # Evaluates the layer at the cells spanned by the coordinate axes, or only
+    # at the masked cells when given. Other cells are left at zero.
+    if not isinstance(sizes, dict):
+      sizes = {sizes: 1}
+    if mask is not None and not mask.any():
+      return np.zeros(mask.shape)
+    value = 0
+    for size, weight in sizes.items():
+      value = value + weight * self._layer(xs / size, ys / size, z, mask)
+    if normalize:
+      value /= sum(sizes.values())
+    return value
+
+  def _layer(self, xs, ys, z, mask):
+    shape = (len(xs), len(ys))
+    if mask is None:
+      x, y = np.meshgrid(xs, ys, indexing='ij')
+      return _noise3(self._perm, self._grad, x.ravel(), y.ravel(), z).reshape(
+          shape)
+    cells = np.nonzero(mask)
+    values = np.zeros(shape)
+    values[cells] = _noise3(
+        self._perm, self._grad, xs[cells[0]], ys[cells[1]], z)
+    return values
+
+
+def _permutation(seed):
+  # Same permutation as opensimplex.OpenSimplex(seed), along with the gradient
+  # for each entry.
+  def step(seed):
+    seed = seed * 6364136223846793005 + 1442695040888963407
+    return (seed + 2 ** 63) % 2 ** 64 - 2 ** 63
+  for _ in range(3):
+    seed = step(seed)
+  perm = np.zeros(256, np.int64)
+  source = list(range(256))
+  for i in range(255, -1, -1):
+    seed = step(seed)
+    r = (seed + 31) % (i + 1)
+    perm[i] = source[r]
+    source[r] = source[i]
+  return perm, _GRADIENTS3[perm % len(_GRADIENTS3)]
+
+
+def _noise3(perm, grad, x, y, z):
+  # Port of the scalar noise3 of opensimplex to arrays of points. Points are
+  # grouped by the region of the super-cell that they fall into and every
+  # region adds up the same contributions with the same arithmetic in the same
+  # order as the scalar version, so the values match it bit for bit.
+  stretch = (x + y + z) * _STRETCH3
+  xs, ys, zs = x + stretch, y + stretch, z + stretch
+  xsb, ysb, zsb = np.floor(xs), np.floor(ys), np.floor(zs)
+  squish = (xsb + ysb + zsb) * _SQUISH3
+  d0 = x - (xsb + squish), y - (ysb + squish), z - (zsb + squish)
+  ins = xs - xsb, ys - ysb, zs - zsb
+  base = xsb.astype(np.int64), ysb.astype(np.int64), zsb.astype(np.int64)
+  in_sum = ins[0] + ins[1] + ins[2]
+  regions = (in_sum <= 1, in_sum >= 2, (in_sum > 1) & (in_sum < 2))
+  value = np.zeros(np.shape(x))
+  for region, (cells, points) in enumerate(zip(regions, _REGIONS)):
+    if not cells.any():
+      continue
+    sb = [axis[cells] for axis in base]
+    d = [axis[cells] for axis in d0]
+    extra = _EXTRA[region](d, sb, [axis[cells] for axis in ins])
+    total = np.zeros(len(sb[0]))
+    for point in points:
+      shift = sum(point) * _SQUISH3
+      total += _contribution(
+          perm, grad, [s + i for s, i in zip(sb, point)],
+          [(a - i) - shift for a, i in zip(d, point)])
+    for vertex, delta in extra:
+      total += _contribution(perm, grad, vertex, delta)
+    value[cells] = total
+  return value / _NORM3
+
+
+def _contribution(perm, grad, vertex, delta):
+  dx, dy, dz = delta
+  attn = 2 - dx * dx - dy * dy - dz * dz
+  index = (perm[(perm[vertex[0] & 0xFF] + vertex[1]) & 0xFF] + vertex[2]) & 0xFF
+  g = grad[index]
+  extrapolation = g[:, 0] * dx + g[:, 1] * dy + g[:, 2] * dz
+  square = attn * attn
+  return np.where(attn > 0, square * square * extrapolation, 0)
+
+
+def _extra_inner(d, sb, ins):
+  # The two lattice points outside of the tetrahedron at (0, 0, 0) that can
+  # contribute, as the vertex and the offset to it per axis.
+  (dx0, dy0, dz0), (xsb, ysb, zsb), (xins, yins, zins) = d, sb, ins
+  a_point, a_score = np.full(len(xsb), 1), xins
+  b_point, b_score = np.full(len(xsb), 2), yins
+  swap_b = (a_score >= b_score) & (zins > b_score)
+  swap_a = (a_score < b_score) & (zins > a_score)
+  b_point, b_score = _swap(swap_b, 4, zins, b_point, b_score)
+  a_point, a_score = _swap(swap_a, 4, zins, a_point, a_score)
+  wins = 1 - (xins + yins + zins)
+  near = (wins > a_score) | (wins > b_score)
+  c = np.where(near, np.where(b_score > a_score, b_point, a_point),
+               a_point | b_point)
+  sq, sq2 = _SQUISH3, 2 * _SQUISH3
+  # The (0, 0, 0) vertex is one of the closest two.
+  cx, cy, cz = (c & 1) == 0, (c & 2) == 0, (c & 4) == 0
+  near_x = _choose(
+      cx, (xsb - 1, xsb, dx0 + 1, dx0), (xsb + 1, xsb + 1, dx0 - 1, dx0 - 1))
+  near_y = _choose(
+      cy & cx, (ysb, ysb - 1, dy0, dy0 + 1),
+      cy, (ysb - 1, ysb, dy0 + 1, dy0),
+      (ysb + 1, ysb + 1, dy0 - 1, dy0 - 1))
+  near_z = _choose(
+      cz, (zsb, zsb - 1, dz0, dz0 + 1), (zsb + 1, zsb + 1, dz0 - 1, dz0 - 1))
+  # Otherwise the extra vertices follow from the closest two.
+  far = [
+      _choose(
+          free, (base, base - 1, delta - sq2, delta + 1 - sq),
+          (base + 1, base + 1, delta - 1 - sq2, delta - 1 - sq))
+      for free, base, delta in zip((cx, cy, cz), sb, d)]
+  axes = [
+      _choose(near, one, two)
+      for one, two in zip((near_x, near_y, near_z), far)]
+  return _vertices(axes)
+
+
+def _extra_outer(d, sb, ins):
+  # The two lattice points outside of the tetrahedron at (1, 1, 1) that can
+  # contribute.
+  (dx0, dy0, dz0), (xsb, ysb, zsb), (xins, yins, zins) = d, sb, ins
+  a_point, a_score = np.full(len(xsb), 6), xins
+  b_point, b_score = np.full(len(xsb), 5), yins
+  swap_b = (a_score <= b_score) & (zins < b_score)
+  swap_a = (a_score > b_score) & (zins < a_score)
+  b_point, b_score = _swap(swap_b, 3, zins, b_point, b_score)
+  a_point, a_score = _swap(swap_a, 3, zins, a_point, a_score)
+  wins = 3 - (xins + yins + zins)
+  near = (wins < a_score) | (wins < b_score)
+  c = np.where(near, np.where(b_score < a_score, b_point, a_point),
+               a_point & b_point)
+  sq, sq2, sq3 = _SQUISH3, 2 * _SQUISH3, 3 * _SQUISH3
+  # The (1, 1, 1) vertex is one of the closest two.
+  cx, cy, cz = (c & 1) != 0, (c & 2) != 0, (c & 4) != 0
+  near_x = _choose(
+      cx, (xsb + 2, xsb + 1, dx0 - 2 - sq3, dx0 - 1 - sq3),
+      (xsb, xsb, dx0 - sq3, dx0 - sq3))
+  dy = dy0 - 1 - sq3
+  near_y = _choose(
+      cy & cx, (ysb + 1, ysb + 2, dy, dy - 1),
+      cy, (ysb + 2, ysb + 1, dy - 1, dy),
+      (ysb, ysb, dy0 - sq3, dy0 - sq3))
+  near_z = _choose(
+      cz, (zsb + 1, zsb + 2, dz0 - 1 - sq3, dz0 - 2 - sq3),
+      (zsb, zsb, dz0 - sq3, dz0 - sq3))
+  # Otherwise the extra vertices follow from the closest two.
+  far = [
+      _choose(
+          shared, (base + 1, base + 2, delta - 1 - sq, delta - 2 - sq2),
+          (base, base, delta - sq, delta - sq2))
+      for shared, base, delta in zip((cx, cy, cz), sb, d)]
+  axes = [
+      _choose(near, one, two)
+      for one, two in zip((near_x, near_y, near_z), far)]
+  return _vertices(axes)
+
+
+def _extra_middle(d, sb, ins):
+  # The two lattice points outside of the octahedron in between that can
+  # contribute.
+  (dx0, dy0, dz0), (xsb, ysb, zsb), (xins, yins, zins) = d, sb, ins
+  p1, p2, p3 = xins + yins, xins + zins, yins + zins
+  a_far, b_far, score_far = p1 > 1, p2 > 1, p3 > 1
+  a_score = np.where(a_far, p1 - 1, 1 - p1)
+  b_score = np.where(b_far, p2 - 1, 1 - p2)
+  score = np.where(score_far, p3 - 1, 1 - p3)
+  a_point = np.where(a_far, 3, 4)
+  b_point = np.where(b_far, 5, 2)
+  point = np.where(score_far, 6, 1)
+  # The closest of (1, 0, 0) and (0, 1, 1) replaces the furthest of the two
+  # above if it is closer.
+  swap_a = (a_score <= b_score) & (a_score < score)
+  swap_b = (a_score > b_score) & (b_score < score)
+  a_point, a_far = _swap(swap_a, point, score_far, a_point, a_far)
+  b_point, b_far = _swap(swap_b, point, score_far, b_point, b_far)
+  sq, sq2, sq3 = _SQUISH3, 2 * _SQUISH3, 3 * _SQUISH3
+  # Both closest points are on the (1, 1, 1) side.
+  shared = a_point & b_point
+  far0 = (
+      xsb + 1, ysb + 1, zsb + 1, dx0 - 1 - sq3, dy0 - 1 - sq3, dz0 - 1 - sq3)
+  far1 = _choose(
+      (shared & 1) != 0,
+      (xsb + 2, ysb, zsb, dx0 - 2 - sq2, dy0 - sq2, dz0 - sq2),
+      (shared & 2) != 0,
+      (xsb, ysb + 2, zsb, dx0 - sq2, dy0 - 2 - sq2, dz0 - sq2),
+      (xsb, ysb, zsb + 2, dx0 - sq2, dy0 - sq2, dz0 - 2 - sq2))
+  # Both closest points are on the (0, 0, 0) side.
+  omitted = a_point | b_point
+  flips = (
+      (xsb - 1, ysb + 1, zsb + 1, dx0 + 1 - sq, dy0 - 1 - sq, dz0 - 1 - sq),
+      (xsb + 1, ysb - 1, zsb + 1, dx0 - 1 - sq, dy0 + 1 - sq, dz0 - 1 - sq),
+      (xsb + 1, ysb + 1, zsb - 1, dx0 - 1 - sq, dy0 - 1 - sq, dz0 + 1 - sq))
+  near0 = (xsb, ysb, zsb, dx0, dy0, dz0)
+  near1 = _choose(
+      (omitted & 1) == 0, flips[0], (omitted & 2) == 0, flips[1],
+      flips[2])
+  # One closest point on each side.
+  c1 = np.where(a_far, a_point, b_point)
+  c2 = np.where(a_far, b_point, a_point)
+  mixed0 = _choose(
+      (c1 & 1) == 0, flips[0], (c1 & 2) == 0, flips[1], flips[2])
+  dx, dy, dz = dx0 - sq2, dy0 - sq2, dz0 - sq2
+  mixed1 = _choose(
+      (c2 & 1) != 0, (xsb + 2, ysb, zsb, dx - 2, dy, dz),
+      (c2 & 2) != 0, (xsb, ysb + 2, zsb, dx, dy - 2, dz),
+      (xsb, ysb, zsb + 2, dx, dy, dz - 2))
+  same = a_far == b_far
+  vertex0 = _choose(same & a_far, far0, same, near0, mixed0)
+  vertex1 = _choose(same & a_far, far1, same, near1, mixed1)
+  return [
+      (vertex[:3], vertex[3:]) for vertex in (vertex0, vertex1)]
+
+
+def _swap(cond, point, value, points, values):
+  return np.where(cond, point, points), np.where(cond, value, values)
+
+
+def _choose(*branches):
+  # Picks per point between tuples of arrays, given as conditions followed by
+  # their tuples and a last tuple for the points that match no condition.
+  *pairs, default = branches
+  conds, choices = pairs[0::2], pairs[1::2]
+  return tuple(
+      np.select(conds, [choice[k] for choice in choices], default[k])
+      for k in range(len(default)))
+
+
+def _vertices(axes):
+  # Rearranges the choices per axis of sv0, sv1, d0, d1 into the two
+  # vertices and their offsets.
+  (x0, x1, dx0, dx1), (y0, y1, dy0, dy1), (z0, z1, dz0, dz1) = axes
+  return [((x0, y0, z0), (dx0, dy0, dz0)), ((x1, y1, z1), (dx1, dy1, dz1))]
+
+
+_EXTRA = (_extra_inner, _extra_outer, _extra_middle)
@@ -0,0 +1,233 @@
+import itertools
+
+import numpy as np
+
+import crafter
+from crafter import affordances
+from crafter import constants
+from crafter import engine
+from crafter import objects
+
+DIRECTIONS = {
+    'west': (-1, 0), 'east': (+1, 0), 'north': (0, -1), 'south': (0, +1)}
+BLOCKING = ['cow', 'skeleton', 'zombie', 'plant', 'plant-ripe']
+KINDS = [None] + BLOCKING
+NEARBY = [(), ('table',), ('table', 'furnace'), ('stone', 'path'), ('stone',)]
+INVENTORIES = [
+    {},
+    {'wood': 1},
+    {'wood': 2},
+    {'wood': 1, 'wood_pickaxe': 1},
+    {'wood': 1, 'stone': 1},
+    {'wood': 1, 'stone': 1, 'stone_pickaxe': 1},
+    {'stone': 4},
+    {'stone': 4, 'wood': 2},
+    {'wood': 1, 'coal': 1, 'iron': 1},
+    {'wood': 1, 'coal': 1, 'iron': 1, 'iron_pickaxe': 1},
+    {'sapling': 1, 'wood_pickaxe': 1, 'wood_sword': 1},
+    {'wood_sword': 1, 'stone_pickaxe': 1, 'stone_sword': 1},
+    {'iron_pickaxe': 1, 'iron_sword': 1},
+    {name: 9 for name in constants.items},
+]
+
+
+def _reference(player):
+  # The rules as they were written before they were compiled into a table.
+  result = []
+  for direction, diff in DIRECTIONS.items():
+    target = (player.pos[0] + diff[0], player.pos[1] + diff[1])
+    material, obj = player.world[target]
+    texture = obj.texture if obj else None
+    if material in ['grass', 'sand', 'path'] and texture not in BLOCKING:
+      result.append(f'move_{direction}')
+    elif diff != player.facing:
+      if texture in BLOCKING:
+        result.append(f'face_{direction}_obstructed_by_{texture}')
+      if material in ['tree', 'stone', 'coal', 'iron', 'diamond', 'water']:
+        result.append(f'face_{direction}_obstructed_by_{material}')
+  facing = {v: k for k, v in DIRECTIONS.items()}[player.facing]
+  target = (player.pos[0] + player.facing[0], player.pos[1] + player.facing[1])
+  material, obj = player.world[target]
+  inv = player.inventory
+  if material == 'water' and inv['wood_pickaxe'] >= 1:
+    result.append(f'collect_drink_on_{facing}')
+  if material == 'tree':
+    result.append(f'collect_wood_on_{facing}')
+  if material == 'stone' and inv['wood_pickaxe'] >= 1:
+    result.append(f'collect_stone_on_{facing}')
+  if material == 'coal' and inv['wood_pickaxe'] >= 1:
+    result.append(f'collect_coal_on_{facing}')
+  if material == 'iron' and inv['stone_pickaxe'] >= 1:
+    result.append(f'collect_iron_on_{facing}')
+  if material == 'diamond' and inv['iron_pickaxe'] >= 1:
+    result.append(f'collect_diamond_on_{facing}')
+  if material == 'grass' and inv['wood_pickaxe'] >= 1 and (
+      inv['wood_sword'] >= 1):
+    result.append(f'collect_sapling_on_{facing}')
+  if material == 'grass' and inv['sapling'] >= 1 and (
+      inv['wood_pickaxe'] >= 1 and inv['wood_sword'] >= 1):
+    result.append(f'place_plant_on_{facing}')
+  nearby, _ = player.world.nearby(player.pos, 1)
+  if obj:
+    texture = obj.texture
+    if texture == 'cow' and inv['wood_sword'] >= 1 and (
+        inv['wood_pickaxe'] >= 1):
+      result.append(f'eat_cow_on_{facing}')
+    if texture == 'skeleton' and inv['wood_sword'] >= 1:
+      result.append(f'defeat_skeleton_on_{facing}')
+    if texture == 'zombie' and inv['wood_sword'] >= 1:
+      result.append(f'defeat_zombie_on_{facing}')
+    if texture == 'plant-ripe' and 'stone' in nearby and (
+        inv['iron_sword'] >= 1):
+      result.append(f'eat_plant_on_{facing}')
+  if 'table' in nearby:
+    if inv['wood'] >= 1:
+      result.append('make_wood_pickaxe')
+      if inv['wood_pickaxe'] >= 1:
+        result.append('make_wood_sword')
+    if inv['wood'] >= 1 and inv['stone'] >= 1:
+      result.append('make_stone_pickaxe')
+      if inv['stone_pickaxe'] >= 1:
+        result.append('make_stone_sword')
+  if 'table' in nearby and 'furnace' in nearby:
+    if inv['wood'] >= 1 and inv['coal'] >= 1 and inv['iron'] >= 1:
+      result.append('make_iron_pickaxe')
+      if inv['iron_pickaxe'] >= 1:
+        result.append('make_iron_sword')
+  if material in ['grass', 'path'] and obj is None:
+    if inv['wood'] >= 2:
+      result.append(f'place_table_on_{material}_to_{facing}')
+    if inv['stone'] >= 4 and 'table' in nearby:
+      result.append(f'place_furnace_on_{material}_to_{facing}')
+  if material in ['grass', 'sand', 'path', 'water', 'lava'] and obj is None:
+    if inv['stone'] >= 1:
+      result.append(f'place_stone_on_{material}_to_{facing}')
+  if 'stone' in nearby and 'path' in nearby and inv['stone_sword'] >= 1:
+    result.append('sleep')
+  return result
+
+
+def _world(pos, area=(9, 9)):
+  world = engine.World(area, constants.materials, (9, 9), 0)
+  world.set_materials(np.full(area, world._mat_ids['sand'], np.uint8))
+  player = objects.Player(world, pos)
+  world.add(player)
+  return world, player
+
+
+def _place(world, player, pos, kind):
+  if kind is None:
+    return
+  if kind == 'cow':
+    obj = objects.Cow(world, pos)
+  elif kind == 'zombie':
+    obj = objects.Zombie(world, pos, player)
+  elif kind == 'skeleton':
+    obj = objects.Skeleton(world, pos, player)
+  else:
+    obj = objects.Plant(world, pos)
+    obj.grown = 301 if kind == 'plant-ripe' else 0
+  world.add(obj)
+
+
+def _clear(world, player):
+  for obj in world.objects:
+    if obj is not player:
+      world.remove(obj)
+
+
+def _equip(player, inventory):
+  for name in player.inventory:
+    player.inventory[name] = inventory.get(name, 0)
+
+
+def test_rules_match_reference():
+  world, player = _world((4, 4))
+  rng = np.random.RandomState(0)
+  materials = list(constants.materials)
+  corners = [(3, 3), (3, 5), (5, 3), (5, 5)]
+  states = itertools.product(
+      DIRECTIONS.values(), materials, KINDS, NEARBY, INVENTORIES)
+  checked = 0
+  for facing, material, kind, nearby, inventory in states:
+    _clear(world, player)
+    player.facing = facing
+    for diff in DIRECTIONS.values():
+      pos = (4 + diff[0], 4 + diff[1])
+      if diff == facing:
+        world[pos] = material
+        _place(world, player, pos, kind)
+      else:
+        world[pos] = materials[rng.randint(len(materials))]
+        _place(world, player, pos, KINDS[rng.randint(len(KINDS))])
+    for index, pos in enumerate(corners):
+      world[pos] = nearby[index] if index < len(nearby) else 'sand'
+    _equip(player, inventory)
+    assert player._available_action('') == _reference(player), (
+        facing, material, kind, nearby, inventory)
+    checked += 1
+  assert checked > 10000
+
+
+def _border_states(seed):
+  # Players at the border and in the middle of small random worlds.
+  rng = np.random.RandomState(seed)
+  materials = list(constants.materials)
+  for pos in itertools.product((0, 4, 8), (0, 4, 8)):
+    world, player = _world(pos)
+    for _ in range(50):
+      _clear(world, player)
+      world.set_materials(rng.choice(
+          [world._mat_ids[name] for name in materials],
+          world.area).astype(np.uint8))
+      for diff in DIRECTIONS.values():
+        target = (pos[0] + diff[0], pos[1] + diff[1])
+        if 0 <= target[0] < 9 and 0 <= target[1] < 9:
+          _place(world, player, target, KINDS[rng.randint(len(KINDS))])
+      player.facing = list(DIRECTIONS.values())[rng.randint(4)]
+      _equip(player, INVENTORIES[rng.randint(len(INVENTORIES))])
+      yield player
+
+
+def _episode_states(steps=300):
+  env = crafter.Env(area=(32, 32), seed=2)
+  env.reset()
+  rng = np.random.RandomState(2)
+  for _ in range(steps):
+    env.step(rng.randint(0, 17))
+    yield env._player
+
+
+def _record(player):
+  # The state as a caller of pack() would gather it from the world.
+  world = player.world
+  x, y = player.pos.tolist()
+  materials, kinds = [], []
+  for i, j in DIRECTIONS.values():
+    material, obj = world[(x + i, y + j)]
+    materials.append(world._mat_ids[material] if material else 0)
+    kinds.append(affordances.kind(obj))
+  nearby = np.zeros(9, int)
+  names, _ = world.nearby(player.pos, 1)
+  nearby[:len(names)] = [world._mat_ids[name] for name in names]
+  facing = list(DIRECTIONS.values()).index(tuple(player.facing))
+  inventory = [player.inventory[name] for name in constants.items]
+  return materials, kinds, facing, nearby, inventory
+
+
+def test_rules_at_border():
+  for player in _border_states(1):
+    assert player._available_action('') == _reference(player), player.pos
+
+
+def test_pack_matches_encode():
+  states, keys, found = [], [], []
+  players = itertools.chain(_border_states(2), _episode_states())
+  for player in players:
+    states.append(_record(player))
+    keys.append(affordances.encode(player))
+    found.append(affordances.available(player))
+  packed = affordances.pack(*map(np.array, zip(*states)))
+  assert packed.tolist() == keys
+  assert affordances.available_many(packed) == found
+  assert affordances.available_many(packed.reshape(-1, 3)) == found
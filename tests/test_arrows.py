@@ -0,0 +1,125 @@
+import functools
+
+import numpy as np
+import pytest
+
+from crafter import constants
+from crafter import engine
+from crafter import objects
+
+EAST, WEST, NORTH, SOUTH = (1, 0), (-1, 0), (0, -1), (0, 1)
+
+
+@pytest.fixture(autouse=True)
+def _always_batch(monkeypatch):
+  monkeypatch.setattr(objects, '_MIN_BATCH', 1)
+
+
+def _world(batched, materials):
+  store = batched and functools.partial(
+      objects.CreatureStore, (objects.Arrow,))
+  world = engine.World(
+      (32, 32), constants.materials, (12, 12), 0, creature_store=store)
+  world.set_materials(np.array(
+      [[world._mat_ids[name] for name in row] for row in materials],
+      np.uint8))
+  player = objects.Player(world, (16, 30))
+  world.add(player)
+  return world, player
+
+
+def _run(batched, materials, arrows, others=(), steps=4):
+  world, player = _world(batched, materials)
+  for cls, pos in others:
+    world.add(cls(world, pos))
+  for pos, facing in arrows:
+    world.add(objects.Arrow(world, pos, np.array(facing)))
+  objs = world.objects
+  for _ in range(steps):
+    group = [obj for obj in world.objects if type(obj) is objects.Arrow]
+    if batched:
+      world.creatures.update(group, player, 64)
+    else:
+      for obj in group:
+        obj.update()
+  # Slots can be numbered differently after compaction, so the object map is
+  # compared by which object is where.
+  ids = {id(obj): index for index, obj in enumerate(objs)}
+  occupants = [
+      [ids[id(world._objects[index])] if index else -1 for index in row]
+      for row in world._obj_map.tolist()]
+  return (
+      world._mat_map.tolist(), occupants,
+      [(tuple(obj.pos.tolist()), obj.health, obj.removed) for obj in objs])
+
+
+def _compare(materials, arrows, others=()):
+  sequential = _run(False, materials, arrows, others)
+  assert _run(True, materials, arrows, others) == sequential
+  return sequential
+
+
+def _grass():
+  return [['grass'] * 32 for _ in range(32)]
+
+
+def test_arrows_hitting_arrows():
+  # The arrow that flies first hits the other one or finds its cell empty.
+  _, _, objs = _compare(_grass(), [((5, 5), EAST), ((6, 5), NORTH)])
+  assert objs[1] == ((5, 5), 0, True)
+  assert objs[2] == ((6, 1), 0, False)
+  _, _, objs = _compare(_grass(), [((6, 5), NORTH), ((5, 5), EAST)])
+  assert objs[1][2] is objs[2][2] is False
+  # Arrows flying at each other.
+  _compare(_grass(), [((5, 10), EAST), ((7, 10), WEST)])
+  _compare(_grass(), [((5, 10), EAST), ((8, 10), WEST)])
+
+
+def test_chains_of_arrows_in_one_lane():
+  lane = [((x, 8), EAST) for x in range(5, 10)]
+  _, _, objs = _compare(_grass(), lane)
+  # Only the front arrow flies when the arrows behind it go first.
+  assert [obj[2] for obj in objs[1:]] == [True] * 4 + [False]
+  _, _, objs = _compare(_grass(), lane[::-1])
+  assert [obj[2] for obj in objs[1:]] == [False] * 5
+  _compare(_grass(), lane[::2] + lane[1::2])
+
+
+def test_arrows_destroy_tables_and_furnaces():
+  materials = _grass()
+  materials[11][12] = 'table'
+  materials[11][20] = 'furnace'
+  materials[14][12] = 'stone'
+  arrows = [
+      ((10, 12), EAST), ((11, 13), NORTH), ((12, 12), WEST),
+      ((11, 21), NORTH), ((11, 19), SOUTH), ((13, 12), EAST)]
+  mat_map, _, objs = _compare(materials, arrows)
+  assert mat_map[11][12] == mat_map[11][20] == constants.materials.index(
+      'path') + 1
+  assert mat_map[14][12] == constants.materials.index('stone') + 1
+  # The arrow that flies after the table broke enters its cell.
+  assert objs[1][2] and not objs[2][2]
+
+
+def test_arrows_leave_at_the_border():
+  arrows = [
+      ((0, 3), WEST), ((31, 3), EAST), ((4, 0), NORTH), ((4, 31), SOUTH),
+      ((1, 5), WEST), ((30, 5), EAST), ((2, 7), WEST)]
+  _, obj_map, objs = _compare(_grass(), arrows)
+  assert all(obj[2] for obj in objs[1:])
+  assert sum(index >= 0 for row in obj_map for index in row) == 1
+
+
+def test_random_arrows_match_updates_in_turn():
+  rng = np.random.RandomState(0)
+  names = ['grass', 'sand', 'path', 'water', 'lava', 'stone', 'tree',
+           'table', 'furnace']
+  for _ in range(10):
+    materials = rng.choice(
+        names, (32, 32), p=[0.4, 0.1, 0.1, 0.1, 0.05, 0.1, 0.05, 0.05, 0.05])
+    cells = rng.permutation([(x, y) for x in range(32) for y in range(32)])
+    cells = [tuple(cell) for cell in cells.tolist() if cell != [16, 30]]
+    dirs = (EAST, WEST, NORTH, SOUTH)
+    arrows = [(cell, dirs[rng.randint(4)]) for cell in cells[:150]]
+    others = [(objects.Cow, cell) for cell in cells[150:170]]
+    _compare(materials.tolist(), arrows, others)
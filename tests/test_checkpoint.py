@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+import crafter
+from crafter import checkpoint
+
+
+def _run(env, actions):
+  trajectory = []
+  for action in actions:
+    obs, reward, done, info = env.step(action)
+    trajectory.append((
+        obs.tobytes(), reward, done, info['semantic'].tobytes(),
+        dict(info['inventory']), dict(info['achievements'])))
+    if done:
+      break
+  return trajectory
+
+
+def _saved(tmp_path, steps=100, **kwargs):
+  env = crafter.Env(area=(32, 32), seed=4, **kwargs)
+  env.reset()
+  rng = np.random.RandomState(0)
+  _run(env, rng.randint(0, 17, steps))
+  path = tmp_path / 'world.crafter'
+  env.save(path)
+  return env, path
+
+
+def _patch(path, offset, data):
+  content = bytearray(path.read_bytes())
+  content[offset: offset + len(data)] = data
+  path.write_bytes(bytes(content))
+
+
+def test_load_continues_like_uninterrupted_run(tmp_path):
+  env, path = _saved(tmp_path)
+  actions = np.random.RandomState(1).randint(0, 17, 300)
+  expected = _run(env, actions)
+  other = crafter.Env(area=(32, 32), seed=99)
+  other.load(path)
+  assert _run(other, actions) == expected
+  env.load(path)
+  assert _run(env, actions) == expected
+
+
+def test_load_keeps_slots_of_objects(tmp_path):
+  # With slot reuse, new objects take the free slots of removed ones, so the
+  # slots of the objects and the free slots decide the update order.
+  env = crafter.Env(area=(32, 32), seed=4, reuse_slots=True)
+  env.reset()
+  rng = np.random.RandomState(0)
+  _run(env, rng.randint(0, 17, 100))
+  world = env._world
+  for obj in world.objects[1::3]:
+    if obj is not env._player:
+      world.remove(obj)
+  assert world._free
+  path = tmp_path / 'world.crafter'
+  env.save(path)
+  actions = np.random.RandomState(1).randint(0, 17, 300)
+  slots = world._obj_map.copy(), list(world._free), world._holes
+  expected = _run(env, actions)
+  other = crafter.Env(area=(32, 32), seed=99, reuse_slots=True)
+  other.load(path)
+  world = other._world
+  assert np.array_equal(world._obj_map, slots[0])
+  assert (world._free, world._holes) == slots[1:]
+  assert _run(other, actions) == expected
+
+
+def test_arrays_are_aligned_and_read_only(tmp_path):
+  env, path = _saved(tmp_path, steps=10)
+  header, arrays = checkpoint.read(path)
+  assert header['step'] == 10
+  assert np.array_equal(arrays['mat_map'], env._world._mat_map)
+  for array in arrays.values():
+    assert not array.flags.writeable
+    assert array.__array_interface__['data'][0] % checkpoint.ALIGN == 0
+  assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_rejects_bad_magic_and_version(tmp_path):
+  _, path = _saved(tmp_path, steps=1)
+  env = crafter.Env(area=(32, 32))
+  content = path.read_bytes()
+  _patch(path, 0, b'CRAFTEX\0')
+  with pytest.raises(ValueError, match='Not a crafter checkpoint'):
+    env.load(path)
+  path.write_bytes(content)
+  version = np.array([checkpoint.VERSION + 1], '<u4').tobytes()
+  _patch(path, len(checkpoint.MAGIC), version)
+  with pytest.raises(ValueError, match='Unsupported checkpoint version'):
+    env.load(path)
+
+
+def test_rejects_other_area_and_materials(tmp_path):
+  _, path = _saved(tmp_path, steps=1)
+  with pytest.raises(ValueError, match='area'):
+    crafter.Env(area=(48, 48)).load(path)
+  content = path.read_bytes()
+  # Renaming a material keeps the length of the header.
+  offset = content.index(b'"water"')
+  _patch(path, offset, b'"wader"')
+  with pytest.raises(ValueError, match='materials'):
+    crafter.Env(area=(32, 32)).load(path)
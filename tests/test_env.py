@@ -0,0 +1,90 @@
+import json
+
+import numpy as np
+import pytest
+
+import crafter
+from crafter import constants
+
+
+def test_semantic_info_is_kept_per_step():
+  env = crafter.Env(area=(32, 32), seed=0)
+  env.reset()
+  maps = []
+  for step in range(50):
+    _, _, _, info = env.step(step % 5)
+    maps.append(info['semantic'])
+  assert not any(np.shares_memory(maps[0], other) for other in maps[1:])
+  assert not np.array_equal(maps[0], maps[-1])
+  assert np.array_equal(maps[-1], env._sem_view())
+
+
+def test_observation_space_rejects_text():
+  env = crafter.Env(observation=('pixels', 'semantic'))
+  assert set(env.observation_space.spaces) == {'pixels', 'semantic'}
+  for observation in ('text', ('text', 'pixels')):
+    env = crafter.Env(observation=observation)
+    with pytest.raises(ValueError):
+      env.observation_space
+
+
+def test_counts_info_are_dicts():
+  env = crafter.Env(area=(32, 32), seed=0)
+  env.reset()
+  _, _, _, info = env.step(0)
+  inventory = env._player.inventory
+  assert type(info['inventory']) is dict
+  assert type(info['achievements']) is dict
+  assert info['inventory'] == dict(inventory.items())
+  assert info['inventory']['health'] == inventory['health']
+  json.dumps(info['inventory'])
+  json.dumps(info['achievements'])
+  inventory['wood'] += 3
+  assert info['inventory']['wood'] == inventory['wood'] - 3
+  items, values = inventory.items(), inventory.values()
+  inventory['wood'] += 1
+  assert ('wood', inventory['wood']) in items
+  assert list(values) == [inventory[name] for name in inventory]
+  assert len(items) == len(values) == len(constants.items)
+  # Copies are separate dicts and follow writes to the array itself.
+  first = inventory.copy()
+  first['wood'] = -1
+  assert inventory.copy()['wood'] == inventory['wood']
+  inventory.array[:] = 2
+  assert inventory.copy() == dict.fromkeys(constants.items, 2)
+
+
+def test_info_keys():
+  full = crafter.Env(area=(32, 32), seed=1)
+  some = crafter.Env(area=(32, 32), seed=1, info_keys=('reward', 'inventory'))
+  none = crafter.Env(area=(32, 32), seed=1, info_keys=())
+  for env in (full, some, none):
+    env.reset()
+  rng = np.random.RandomState(1)
+  for action in rng.randint(0, 17, 100):
+    obs, reward, _, info = full.step(action)
+    assert info['reward'] == reward
+    _, _, _, partial = some.step(action)
+    assert list(partial) == ['inventory', 'reward']
+    assert partial == {key: info[key] for key in partial}
+    other, _, _, empty = none.step(action)
+    assert empty == {} and np.array_equal(obs, other)
+  with pytest.raises(ValueError):
+    crafter.Env(info_keys=('inventory', 'unknown'))
+
+
+def test_recorders_need_info_keys(tmp_path):
+  env = crafter.Env(area=(32, 32), info_keys=('inventory', 'achievements'))
+  with pytest.raises(ValueError):
+    crafter.Recorder(env, tmp_path, save_video=False, save_episode=False)
+  env = crafter.Env(area=(32, 32), info_keys=('reward',))
+  for video, episode in ((True, False), (False, True)):
+    with pytest.raises(ValueError):
+      crafter.Recorder(
+          env, tmp_path, save_stats=False, save_video=video,
+          save_episode=episode)
+  env = crafter.Env(
+      area=(32, 32), info_keys=('reward', 'inventory', 'achievements'))
+  env = crafter.Recorder(env, tmp_path, save_video=False, save_episode=False)
+  env.reset()
+  env.step(0)
@@ -0,0 +1,120 @@
+import numpy as np
+
+import crafter
+from crafter import objects
+
+RADIUS = 18
+
+
+def _garden(seed=0):
+  # An environment with saplings of random age on the grass around the
+  # player.
+  env = crafter.Env(area=(48, 48), seed=seed, length=None)
+  env.reset()
+  world, player = env._world, env._player
+  rng = np.random.RandomState(seed)
+  x, y = player.pos.tolist()
+  for i in range(x - 12, x + 13):
+    for j in range(y - 12, y + 13):
+      if world[(i, j)] == ('grass', None) and rng.uniform() < 0.4:
+        plant = objects.Plant(world, (i, j))
+        plant.grown = int(rng.randint(0, 300))
+        world.add(plant)
+  return env
+
+
+def _plants(env):
+  return [obj for obj in env._world.objects if isinstance(obj, objects.Plant)]
+
+
+def _keep_alive(player):
+  player.health = 9
+  for name in ('food', 'drink', 'energy'):
+    player.inventory[name] = 9
+
+
+def _walk(env, steps, seed):
+  # Only moves and noops, so the player never eats or places plants.
+  rng = np.random.RandomState(seed)
+  for _ in range(steps):
+    _keep_alive(env._player)
+    env.step(int(rng.randint(0, 5)))
+
+
+def test_growth_matches_counting_every_step():
+  env = _garden()
+  player = env._player
+  expected = {plant: plant.grown for plant in _plants(env)}
+  rng = np.random.RandomState(1)
+  for _ in range(400):
+    _keep_alive(player)
+    env.step(int(rng.randint(0, 5)))
+    plants = _plants(env)
+    for plant in plants:
+      # Previously every plant within range of the player counted the step.
+      if np.abs(plant.pos - player.pos).sum() < RADIUS:
+        expected[plant] += 1
+      assert plant.grown == expected[plant]
+      assert plant.ripe == (expected[plant] > 300)
+      assert plant.texture == ('plant-ripe' if plant.ripe else 'plant')
+  assert any(plant.ripe for plant in plants)
+  assert any(not plant.ripe for plant in plants)
+
+
+def test_creature_arriving_next_to_plant_damages_it():
+  env = crafter.Env(area=(48, 48), seed=2, length=None)
+  env.reset()
+  world, player = env._world, env._player
+  plant_pos = player.pos + (4, 0)
+  cow_pos = plant_pos + (2, 0)
+  # Stone around both cells keeps everything else away and the cow in place.
+  for pos in (plant_pos, cow_pos):
+    for offset in ((-1, 0), (1, 0), (0, -1), (0, 1), (0, 0)):
+      cell = pos + offset
+      if world[cell][1]:
+        world.remove(world[cell][1])
+      world[cell] = 'stone'
+  plant = objects.Plant(world, plant_pos)
+  world.add(plant)
+  cow = objects.Cow(world, cow_pos)
+  world.add(cow)
+  for _ in range(3):
+    _keep_alive(player)
+    env.step(0)
+  assert not plant.removed and plant.health == 1
+  assert not plant.pending
+  world.move(cow, plant_pos + (1, 0))
+  assert plant.pending
+  _keep_alive(player)
+  env.step(0)
+  assert plant.removed
+
+
+def test_snapshot_restores_growth():
+  env = _garden(seed=3)
+  _walk(env, 50, seed=0)
+  token = env.snapshot()
+  before = [(plant, plant.grown) for plant in _plants(env)]
+  _walk(env, 150, seed=1)
+  expected = [(tuple(plant.pos), plant.grown) for plant in _plants(env)]
+  env.restore(token)
+  assert [(plant, plant.grown) for plant in _plants(env)] == before
+  _walk(env, 150, seed=1)
+  assert [(tuple(plant.pos), plant.grown) for plant in _plants(env)] == (
+      expected)
+
+
+def test_checkpoint_restores_growth(tmp_path):
+  env = _garden(seed=4)
+  _walk(env, 50, seed=0)
+  env.save(tmp_path / 'garden.crafter')
+  before = [(tuple(plant.pos), plant.grown) for plant in _plants(env)]
+  _walk(env, 150, seed=1)
+  expected = [(tuple(plant.pos), plant.grown) for plant in _plants(env)]
+  other = crafter.Env(area=(48, 48), seed=9, length=None)
+  other.load(tmp_path / 'garden.crafter')
+  assert [(tuple(plant.pos), plant.grown) for plant in _plants(other)] == (
+      before)
+  _walk(other, 150, seed=1)
+  assert [(tuple(plant.pos), plant.grown) for plant in _plants(other)] == (
+      expected)
@@ -0,0 +1,64 @@
+import numpy as np
+
+import crafter
+
+
+def _episodes(env, count=3, steps=30):
+  # Observations, rewards and semantic maps of a few short episodes.
+  rng = np.random.RandomState(0)
+  episodes = []
+  for _ in range(count):
+    frames = [env.reset()]
+    for _ in range(steps):
+      obs, reward, _, info = env.step(rng.randint(0, 17))
+      frames += [obs, reward, info['semantic']]
+    episodes.append(frames)
+  env.close()
+  return episodes
+
+
+def _assert_equal(lhs, rhs):
+  assert len(lhs) == len(rhs)
+  for a, b in zip(lhs, rhs):
+    for x, y in zip(a, b):
+      assert np.array_equal(x, y)
+
+
+def test_pooled_episodes_match_reset(tmp_path):
+  kwargs = dict(area=(32, 32), seed=3)
+  expected = _episodes(crafter.Env(**kwargs))
+  # Generated and stored, then drawn from the stored worlds by a new env.
+  _assert_equal(_episodes(crafter.Env(world_pool=tmp_path, **kwargs)), expected)
+  assert len(list(tmp_path.glob('*.crafter'))) == 3
+  _assert_equal(_episodes(crafter.Env(world_pool=tmp_path, **kwargs)), expected)
+  # Generated ahead in the background worker.
+  _assert_equal(_episodes(crafter.Env(prefetch=True, **kwargs)), expected)
+  _assert_equal(_episodes(crafter.Env(
+      prefetch=True, world_pool=tmp_path / 'prefetch', **kwargs)), expected)
+
+
+def test_eviction_keeps_capacity(tmp_path):
+  env = crafter.Env(area=(32, 32), world_pool=tmp_path, pool_capacity=2)
+  paths = []
+  for _ in range(5):
+    env.reset()
+    paths.append(env._pool._path(env._world_seed(env._episode)))
+    assert len(list(tmp_path.glob('*.crafter'))) <= 2
+  env.close()
+  # The most recently used worlds are kept.
+  assert sorted(tmp_path.glob('*.crafter')) == sorted(paths[-2:])
+
+
+def test_close_stops_worker(tmp_path):
+  env = crafter.Env(area=(32, 32), prefetch=True, world_pool=tmp_path)
+  env.reset()
+  executor = env._pool._executor
+  # Wait for the next world so that the worker has started.
+  env._pool._pending[env._world_seed(2)].result()
+  processes = list(executor._processes.values())
+  assert processes and all(process.is_alive() for process in processes)
+  env.close()
+  assert env._pool._executor is None and not env._pool._pending
+  for process in processes:
+    process.join(5)
+    assert not process.is_alive()
@@ -0,0 +1,74 @@
+import numpy as np
+
+import crafter
+
+
+def _run(env, actions):
+  trajectory = []
+  for action in actions:
+    obs, reward, done, info = env.step(action)
+    trajectory.append((
+        obs, reward, done, info['semantic'], dict(info['inventory']),
+        dict(info['achievements']), tuple(info['player_pos'])))
+    if done:
+      break
+  return trajectory
+
+
+def _assert_same(first, second):
+  assert len(first) == len(second)
+  for one, two in zip(first, second):
+    for a, b in zip(one, two):
+      if isinstance(a, np.ndarray):
+        assert np.array_equal(a, b)
+      else:
+        assert a == b
+
+
+def test_restore_replays_trajectory():
+  env = crafter.Env(area=(32, 32), seed=3)
+  env.reset()
+  rng = np.random.RandomState(0)
+  _run(env, rng.randint(0, 17, 100))
+  token = env.snapshot()
+  actions = rng.randint(0, 17, 200)
+  expected = _run(env, actions)
+  env.restore(token)
+  _assert_same(_run(env, actions), expected)
+  # Other steps and even a new episode in between do not affect the token.
+  env.restore(token)
+  _run(env, rng.randint(0, 17, 150))
+  env.reset()
+  env.restore(token)
+  _assert_same(_run(env, actions), expected)
+
+
+def test_changes_do_not_corrupt_shared_materials():
+  env = crafter.Env(area=(32, 32), seed=1)
+  env.reset()
+  world = env._world
+  first = env.snapshot()
+  # The material layer is shared while it does not change.
+  assert env.snapshot()['world']['materials'] is first['world']['materials']
+  before = world._mat_map.copy()
+  world[(0, 0)] = 'lava'
+  world[(1, 0)] = 'stone'
+  saved = first['world']['materials'][1]
+  assert not saved.flags.writeable
+  assert np.array_equal(saved, before)
+  second = env.snapshot()
+  assert second['world']['materials'] is not first['world']['materials']
+  changed = world._mat_map.copy()
+  env.restore(first)
+  assert np.array_equal(world._mat_map, before)
+  assert world[(0, 0)][0] != 'lava'
+  # A branch from the first snapshot that changes other cells gets a new
+  # version, so restoring the second snapshot copies its materials back.
+  world[(2, 0)] = 'water'
+  env.restore(second)
+  assert np.array_equal(world._mat_map, changed)
+  assert (0, 0) in world._positions[world._mat_ids['lava']]
+  env.restore(first)
+  assert np.array_equal(world._mat_map, before)
+  assert (0, 0) not in world._positions.get(world._mat_ids['lava'], ())
+  assert np.array_equal(saved, before)
@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+import crafter
+
+
+def test_steps_and_shares_observations():
+  envs = crafter.VecEnv(2, seed=0, area=(32, 32), context='fork')
+  try:
+    obs = envs.reset()
+    assert obs.shape == (2, 64, 64, 3)
+    obs, rewards, dones, infos = envs.step(np.zeros(2, int))
+    assert obs is envs.observations
+    assert rewards.shape == dones.shape == (2,)
+    assert 'semantic' not in infos[0] and 'inventory' in infos[0]
+    assert envs.semantic.shape == (2, 32, 32) and envs.semantic.any()
+  finally:
+    envs.close()
+
+
+def test_rejects_other_observations():
+  with pytest.raises(AssertionError):
+    crafter.VecEnv(2, observation='text')
@@ -0,0 +1,142 @@
+import numpy as np
+
+import crafter
+from crafter import constants
+from crafter import engine
+from crafter import objects
+
+
+def _world(reuse_slots):
+  world = engine.World(
+      (32, 32), constants.materials, (12, 12), 0, reuse_slots=reuse_slots)
+  world.set_materials(np.full((32, 32), world._mat_ids['grass'], np.uint8))
+  return world
+
+
+def _cows(world, count):
+  cows = []
+  for index in range(count):
+    cow = objects.Cow(world, (index % 32, index // 32))
+    world.add(cow)
+    cows.append(cow)
+  return cows
+
+
+def _assert_consistent(world):
+  for obj in world.objects:
+    assert world._objects[world._obj_map[tuple(obj.pos)]] is obj
+  assert (world._obj_map > 0).sum() == len(world.objects)
+
+
+def test_update_order_without_reuse():
+  world = _world(reuse_slots=False)
+  a, b, c, d, e = _cows(world, 5)
+  world.remove(b)
+  world.remove(d)
+  f, g = objects.Cow(world, (5, 5)), objects.Cow(world, (6, 6))
+  world.add(f)
+  world.add(g)
+  # New objects are updated after all existing ones.
+  assert world.objects == [a, c, e, f, g]
+  assert world.objects_near((5, 5), 40) == [a, c, e, f, g]
+  _assert_consistent(world)
+
+
+def test_update_order_with_reuse():
+  world = _world(reuse_slots=True)
+  a, b, c, d, e = _cows(world, 5)
+  world.remove(d)
+  world.remove(b)
+  f, g, h = [objects.Cow(world, (i, 9)) for i in range(3)]
+  for cow in (f, g, h):
+    world.add(cow)
+  # New objects take the lowest free slot and are updated in its place.
+  assert world.objects == [a, f, c, g, e, h]
+  assert world.objects_near((5, 5), 40) == [a, f, c, g, e, h]
+  _assert_consistent(world)
+
+
+def test_compaction_threshold():
+  for reuse_slots in (False, True):
+    # Small tables compact once more than 64 slots are empty.
+    world = _world(reuse_slots)
+    cows = _cows(world, 70)
+    world.remove_many(cows[:64])
+    assert len(world._objects) == 71 and world._holes == 64
+    world.remove(cows[64])
+    assert len(world._objects) == 6 and world._holes == 0
+    assert world.objects == cows[65:]
+    assert world._free == []
+    _assert_consistent(world)
+    # Larger tables compact once more than half of the slots are empty.
+    world = _world(reuse_slots)
+    cows = _cows(world, 200)
+    for cow in cows[:200:2]:
+      world.remove(cow)
+    assert len(world._objects) == 201 and world._holes == 100
+    world.remove(cows[1])
+    assert len(world._objects) == 100 and world._holes == 0
+    # Compaction keeps the order of the remaining objects.
+    assert world.objects == cows[3:200:2]
+    _assert_consistent(world)
+
+
+def _nearest(world, material, pos, max_dist=None):
+  found = np.argwhere(world._mat_map == world._mat_ids[material])
+  dists = np.abs(found - pos).sum(1)
+  keep = dists <= (np.inf if max_dist is None else max_dist)
+  if not keep.any():
+    return None
+  candidates = zip(dists[keep].tolist(), map(tuple, found[keep].tolist()))
+  return min(candidates)[1]
+
+
+def test_material_queries_match_brute_force():
+  env = crafter.Env(area=(48, 48), seed=0)
+  env.reset()
+  world = env._world
+  rng = np.random.RandomState(0)
+  # Tables are placed and removed again so that the index has to follow.
+  for pos in rng.randint(0, 48, (20, 2)).tolist():
+    world[pos] = 'table'
+  for pos in rng.randint(0, 48, (10, 2)).tolist():
+    world[pos] = 'grass'
+  windows = 0
+  for material in constants.materials:
+    id_ = world._mat_ids[material]
+    assert world.count(material) == (world._mat_map == id_).sum()
+    xs, ys = np.nonzero(world._mat_map == id_)
+    assert world.location(material) == list(zip(xs.tolist(), ys.tolist()))
+    for pos in rng.randint(0, 48, (10, 2)).tolist():
+      for max_dist in (None, 0, 1, 3, 8, 30):
+        # Common materials are searched in the window around the position,
+        # rare ones through their index of positions.
+        if max_dist is not None and (2 * max_dist + 1) ** 2 < len(xs):
+          windows += 1
+        assert world.nearest(material, pos, max_dist) == _nearest(
+            world, material, pos, max_dist), (material, pos, max_dist)
+  assert 0 < windows < len(constants.materials) * 60
+
+
+def test_nearest_breaks_ties_by_position():
+  world = _world(reuse_slots=False)
+  world[(9, 10)] = 'stone'
+  world[(10, 9)] = 'stone'
+  world[(11, 10)] = 'stone'
+  assert world.nearest('stone', (10, 10)) == (9, 10)
+  assert world.nearest('stone', (10, 10), 1) == (9, 10)
+  # Enough stone elsewhere that the window around the position is scanned.
+  for x in range(20, 32):
+    world[(x, 0)] = 'stone'
+  assert world.nearest('stone', (10, 10), 1) == (9, 10)
+  assert world.nearest('stone', (10, 10), 0) is None
+  assert world.nearest('stone', (31, 1), 1) == (31, 0)
+
+
+def test_missing_material():
+  world = _world(reuse_slots=False)
+  assert world.count('diamond') == 0
+  assert world.location('diamond') == []
+  assert world.nearest('diamond', (5, 5)) is None
+  assert world.nearest('diamond', (5, 5), 3) is None
+  assert world.nearest('unknown', (5, 5)) is None
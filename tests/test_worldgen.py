@@ -0,0 +1,67 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+import crafter
+from crafter import worldgen
+
+# Checksums of the materials and objects that the original per-cell generator
+# produced for these seeds and areas.
+BASELINE = [
+    (0, (64, 64), 'e6448727016242ea', '5802c28756624a15'),
+    (7, (64, 64), 'dd1f90d1469e2a7f', 'f5cfe4e93b7255ce'),
+    (3, (48, 32), '4d225b025652b90c', '248c9e9c9927b372'),
+]
+
+
+def _world(seed, area=(64, 64), exact=True):
+  env = crafter.Env(area=area, seed=seed, exact_worldgen=exact)
+  env.reset()
+  return env._world
+
+
+def _checksum(data):
+  return hashlib.sha256(data).hexdigest()[:16]
+
+
+def test_noise_matches_opensimplex():
+  opensimplex = pytest.importorskip('opensimplex')
+  rng = np.random.RandomState(0)
+  points = np.concatenate([
+      rng.uniform(-50, 50, (2000, 2)),
+      np.stack(np.meshgrid(
+          np.arange(32) / 5, np.arange(32) / 3, indexing='ij'),
+          -1).reshape(-1, 2)])
+  for seed in (0, 12345, 2 ** 31 - 2):
+    simplex = opensimplex.OpenSimplex(seed=seed)
+    perm, grad = worldgen._permutation(seed)
+    for z in (0, 3, 8, -2.5):
+      values = worldgen._noise3(perm, grad, points[:, 0], points[:, 1], z)
+      expected = [simplex.noise3(x, y, z) for x, y in points.tolist()]
+      assert values.tolist() == expected
+
+
+@pytest.mark.parametrize('seed, area, materials, objs', BASELINE)
+def test_exact_mode_matches_baseline(seed, area, materials, objs):
+  world = _world(seed, area)
+  assert _checksum(world._mat_map.tobytes()) == materials
+  found = sorted(
+      (type(obj).__name__, *map(int, obj.pos)) for obj in world.objects)
+  assert _checksum(repr(found).encode()) == objs
+
+
+def test_fast_mode_matches_distribution():
+  names = ('Cow', 'Zombie', 'Skeleton')
+  shares, counts = {}, {}
+  for exact in (True, False):
+    worlds = [_world(seed, exact=exact) for seed in range(8)]
+    shares[exact] = np.mean([
+        np.bincount(world._mat_map.ravel(), minlength=len(world._mat_ids))
+        / world._mat_map.size for world in worlds], 0)
+    counts[exact] = np.mean([
+        [sum(type(obj).__name__ == name for obj in world.objects)
+         for name in names]
+        for world in worlds], 0)
+  assert np.abs(shares[True] - shares[False]).max() < 0.005
+  assert (np.abs(counts[True] - counts[False]) <= 0.25 * counts[True] + 3).all()